@@ -1,11 +1,15 @@
-from .engine import create_tables, drop_tables, new_session
+from .engine import close_connections, create_tables, drop_tables, engine, new_session
 from .tables import Group as GroupTable
+from .tables import GroupStatistics as GroupStatisticsTable
 from .tables import Task as TaskTable
 
 __all__ = [
     "TaskTable",
     "GroupTable",
+    "GroupStatisticsTable",
+    "close_connections",
     "create_tables",
     "drop_tables",
+    "engine",
     "new_session",
 ]
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import JSON, DateTime, ForeignKey, select
+from sqlalchemy import JSON, DateTime, ForeignKey, Index, select
 from sqlalchemy.orm import Mapped, mapped_column
 from zoneinfo import ZoneInfo
 
@@ -36,6 +36,12 @@ class Table(Base):
 
 class Task(Table):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_name_source_hash", "name", "source_hash"),
+        Index("ix_tasks_group_id_status", "group_id", "status"),
+        Index("ix_tasks_status_id", "status", "id"),
+        Index("ix_tasks_created_at", "created_at"),
+    )
 
     group_id: Mapped[int] = mapped_column(ForeignKey("groups.id"))
 
@@ -43,6 +49,7 @@ class Task(Table):
     task_id: Mapped[str] = mapped_column(nullable=True)
 
     source_file: Mapped[str] = mapped_column(nullable=True)
+    source_hash: Mapped[str] = mapped_column(nullable=True, index=True)  # sha256 исходного архива
     kpt_file: Mapped[str] = mapped_column(nullable=True)
     status: Mapped[str] = mapped_column(nullable=True)
     error: Mapped[str] = mapped_column(nullable=True)
@@ -52,3 +59,16 @@ class Task(Table):
 
 class Group(Table):
     __tablename__ = "groups"
+
+    # Вес группы при распределении очереди между группами (TaskScheduler)
+    priority: Mapped[int] = mapped_column(default=1, server_default="1")
+
+
+class GroupStatistics(Base):
+    """Число задач группы в каждом статусе (поддерживается Repository при изменении задач)"""
+
+    __tablename__ = "group_statistics"
+
+    group_id: Mapped[int] = mapped_column(ForeignKey("groups.id"), primary_key=True)
+    status: Mapped[str] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(default=0)
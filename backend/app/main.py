@@ -6,9 +6,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 
-from app.db import create_tables
+from app.db import close_connections, create_tables
 from app.routing import data_router, processing_router
-from app.services import Handler
+from app.services import Handler, Repository, pause_manager
 
 
 @asynccontextmanager
@@ -16,8 +16,12 @@ async def app_lifespan(app: FastAPI):
     """Жизненный цикл приложения"""
     await check_folders()
     await create_tables()
+    await Repository.rebuild_statistics()
     await Handler.restart_working_tasks()
+    pause_watch = asyncio.create_task(pause_manager.watch())
     yield
+    pause_watch.cancel()
+    await close_connections()
     # await drop_tables()
 
 
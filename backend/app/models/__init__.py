@@ -1,9 +1,12 @@
 from .groups import Group as GroupModel
-from .tasks import ProcessingParams
+from .pages import Page as PageModel
+from .tasks import ProcessingFormat, ProcessingParams
 from .tasks import Task as TaskModel
 
 __all__ = [
     "TaskModel",
     "GroupModel",
+    "PageModel",
     "ProcessingParams",
+    "ProcessingFormat",
 ]
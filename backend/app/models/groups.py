@@ -6,6 +6,7 @@ from pydantic import BaseModel
 class Group(BaseModel):
     id: int
     name: str
+    priority: int | None = None
     statistics: dict
     created_at: datetime
 
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class Page(BaseModel):
+    """Страница списка: next_cursor передается в параметре after для следующей страницы.
+    total - число записей по всем страницам с учетом фильтров, если его можно получить без подсчета строк"""
+
+    items: list[dict]
+    next_cursor: int | None = None
+    total: int | None = None
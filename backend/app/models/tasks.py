@@ -32,6 +32,7 @@ class ProcessingParams(BaseModel):
     files: list[UploadFile] = Field(File(description="Список файлов для обработки"))
     name: str | None = Field(Form(None, description="Название группы"))
     force_add: bool = Field(Form(False, description="Принудительное добавление"))
+    priority: int = Field(Form(1, ge=1, le=100, description="Приоритет группы (доля очереди обработки)"))
     format: ProcessingFormat = Field(Form(ProcessingFormat.shape_file, description="Формат результатов"))
     merge_objects: bool = Field(Form(False, description="Объединять объекты одного типа"))
     save_default_crs: bool = Field(Form(True, description="Не трансформировать средствами NextGIS"))
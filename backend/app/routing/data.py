@@ -1,19 +1,50 @@
-from fastapi import APIRouter
+from datetime import datetime
+from urllib.parse import quote
+
+from fastapi import APIRouter, Query, Request
 from fastapi.exceptions import HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 
-from app.models import GroupModel, TaskModel
-from app.services import Handler, Repository
+from app.models import GroupModel, PageModel, TaskModel
+from app.services import Handler, Repository, event_bus
 
 router = APIRouter()
 
 
+def get_fields(fields: str | None, model) -> list[str]:
+    """Список запрошенных полей модели; id нужен для курсора и добавляется всегда"""
+    if not fields:
+        return list(model.model_fields)
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(requested) - set(model.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(sorted(unknown))}")
+
+    return ["id"] + [field for field in requested if field != "id"]
+
+
 @router.get("/tasks")
-async def get_tasks() -> list[TaskModel]:
-    """Получение задач"""
+async def get_tasks(
+    limit: int = Query(1000, ge=1, le=5000, description="Размер страницы"),
+    after: int | None = Query(None, description="Курсор: next_cursor предыдущей страницы"),
+    group_id: int | None = Query(None, description="Задачи группы"),
+    status: list[str] | None = Query(None, description="Статусы задач"),
+    created_from: datetime | None = Query(None, description="Добавлены не раньше"),
+    created_to: datetime | None = Query(None, description="Добавлены раньше"),
+    fields: str | None = Query(None, description="Поля задачи через запятую (по умолчанию все)"),
+) -> PageModel:
+    """Получение задач постранично"""
     try:
-        tasks_db = await Repository.get_tasks()
-        return [TaskModel.model_validate(task) for task in tasks_db]
+        fields = get_fields(fields, TaskModel)
+        items = await Repository.get_tasks_page(fields, limit, after, group_id, status, created_from, created_to)
+
+        # Общее число берется из счетчиков групп, по дате добавления счетчиков нет
+        total = None
+        if created_from is None and created_to is None:
+            total = await Repository.count_tasks(status, group_id)
+
+        return PageModel(items=items, next_cursor=items[-1]["id"] if len(items) == limit else None, total=total)
 
     except Exception as e:
         # raise HTTPException(status_code=500, detail=str(e))
@@ -33,11 +64,19 @@ async def get_task(task_id: int) -> TaskModel:
 
 
 @router.get("/groups")
-async def get_groups() -> list[GroupModel]:
-    """Получение групп задач"""
+async def get_groups(
+    limit: int = Query(1000, ge=1, le=5000, description="Размер страницы"),
+    after: int | None = Query(None, description="Курсор: next_cursor предыдущей страницы"),
+    fields: str | None = Query(None, description="Поля группы через запятую (по умолчанию все)"),
+) -> PageModel:
+    """Получение групп задач постранично"""
     try:
-        groups_db = await Repository.get_groups()
-        return [GroupModel.model_validate(group) for group in groups_db]
+        fields = get_fields(fields, GroupModel)
+        groups_db = await Repository.get_groups(limit, after)
+        items = [
+            {field: group[field] for field in fields} for group in groups_db if group["statistics"]["loaded"]
+        ]
+        return PageModel(items=items, next_cursor=groups_db[-1]["id"] if len(groups_db) == limit else None)
     except Exception as e:
         # raise HTTPException(status_code=500, detail=str(e))
         raise e
@@ -86,6 +125,16 @@ async def get_statistics():
         raise e
 
 
+@router.get("/events")
+async def get_events(request: Request):
+    """Поток изменений статусов задач (Server-Sent Events)"""
+    return StreamingResponse(
+        event_bus.stream(request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/tasks/{task_id}/download")
 async def download_task(task_id: int):
     """Скачивание архива с результатами обработки задачи"""
@@ -118,8 +167,16 @@ async def download_task_source(task_id: int):
 async def download_group(group_id: int):
     """Скачивание архива с результатами обработки группы"""
     try:
-        file = await Handler.download_group(group_id)
-        return FileResponse(file)
+        name, stream = await Handler.download_group(group_id)
+        if name is None:
+            raise HTTPException(status_code=404, detail="Группа не найдена")
+
+        # Архив формируется во время отправки, поэтому его размер заранее неизвестен
+        return StreamingResponse(
+            stream,
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(name + '.zip')}"},
+        )
     except Exception as e:
         # raise HTTPException(status_code=500, detail=str(e))
         raise e
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from fastapi.exceptions import HTTPException
 from fastapi.responses import JSONResponse
 
@@ -38,18 +38,28 @@ async def restart_group(group_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.put("/groups/{group_id}/priority")
+async def set_group_priority(group_id: int, priority: int = Query(..., ge=1, le=100)):
+    """Изменение приоритета группы (доли очереди обработки)"""
+    try:
+        await Handler.set_priority(group_id, priority)
+        return JSONResponse(content={"message": "Приоритет группы изменен", "priority": priority})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/status")
 async def status():
     """Получение глобального состояния обработки"""
-    return JSONResponse(content={"status": "paused" if pause_manager.is_paused() else "running"})
+    return JSONResponse(content={"status": "paused" if await pause_manager.is_paused() else "running"})
 
 
 @router.get("/toggle")
 async def toggle():
     """Пауза/продолжение обработки (глобальное состояние)"""
-    if pause_manager.is_paused():
-        pause_manager.unset_pause()
+    if await pause_manager.is_paused():
+        await Handler.resume()
         return JSONResponse(content={"message": "Обработка возобновлена", "status": "running"})
     else:
-        pause_manager.set_pause()
+        await Handler.pause()
         return JSONResponse(content={"message": "Обработка приостановлена", "status": "paused"})
@@ -1,6 +1,7 @@
+from .events import event_bus
 from .handler import Handler
 from .repository import Repository
 from .uploader import Uploader
 from .work_cycle import pause_manager
 
-__all__ = ["Handler", "Uploader", "Repository", "pause_manager"]
+__all__ = ["Handler", "Uploader", "Repository", "event_bus", "pause_manager"]
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import threading
+
+
+class BackgroundLoop:
+    """Постоянный event loop процесса в отдельном потоке.
+
+    Синхронный код (задачи Celery) выполняет в нем корутины, поэтому пул соединений
+    с БД и клиент Toolbox создаются один раз на процесс, а не на каждый вызов asyncio.run.
+    """
+
+    _loop: asyncio.AbstractEventLoop | None = None
+    _loop_pid: int | None = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_loop() -> asyncio.AbstractEventLoop:
+        with BackgroundLoop._lock:
+            # После fork поток с loop в дочерний процесс не переносится
+            if BackgroundLoop._loop is None or BackgroundLoop._loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="background-loop", daemon=True).start()
+                BackgroundLoop._loop, BackgroundLoop._loop_pid = loop, os.getpid()
+
+            return BackgroundLoop._loop
+
+    @staticmethod
+    def is_running() -> bool:
+        return BackgroundLoop._loop is not None and BackgroundLoop._loop_pid == os.getpid()
+
+    @staticmethod
+    def run(coro):
+        """Выполнение корутины в loop процесса с ожиданием результата в вызывающем потоке"""
+        future = asyncio.run_coroutine_threadsafe(coro, BackgroundLoop.get_loop())
+        try:
+            return future.result()
+        except BaseException:
+            # Прерывание ожидания (лимит времени задачи, завершение worker) отменяет и корутину
+            future.cancel()
+            raise
+
+    @staticmethod
+    def stop(cleanup=None):
+        """Остановка loop процесса; cleanup - корутина закрытия соединений, выполняется перед остановкой"""
+        if not BackgroundLoop.is_running():
+            return
+
+        if cleanup is not None:
+            BackgroundLoop.run(cleanup)
+
+        loop = BackgroundLoop._loop
+        loop.call_soon_threadsafe(loop.stop)
+        BackgroundLoop._loop = BackgroundLoop._loop_pid = None
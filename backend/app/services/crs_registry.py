@@ -0,0 +1,60 @@
+import os
+from functools import lru_cache
+
+import yaml
+from pyproj import CRS, Transformer
+
+
+class CRSRegistry:
+    """Кэш параметров МСК на процесс: YAML перечитывается только при изменении файла"""
+
+    def __init__(self, params_path: str, regions_path: str):
+        self._params_path = params_path
+        self._regions_path = regions_path
+        self._files = {}  # путь -> (mtime, данные)
+
+    def _load(self, path: str) -> dict:
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._files.get(path)
+
+        if cached is None or cached[0] != mtime:
+            print(f"CRSRegistry: Загрузка параметров из '{path}'")
+            with open(path) as file:
+                cached = (mtime, yaml.safe_load(file) or {})
+            self._files[path] = cached
+
+        return cached[1]
+
+    def get_params(self) -> dict:
+        """Параметры проекций МСК в формате номер:строка proj"""
+        return self._load(self._params_path)
+
+    def get_regions(self) -> dict:
+        """Сопоставление кадастровых районов с номером проекции МСК"""
+        return self._load(self._regions_path)
+
+    def _get_proj(self, zone: str) -> str:
+        try:
+            return self.get_params()[zone]
+        except KeyError:
+            raise ValueError(f"CRSRegistry: Параметры для CRS '{zone}' не найдены")
+
+    def get_crs(self, zone: str) -> CRS:
+        return CRSRegistry._make_crs(zone, self._get_proj(zone))
+
+    def get_transformer(self, zone: str, target: str = "EPSG:4326") -> Transformer:
+        return CRSRegistry._make_transformer(zone, self._get_proj(zone), target)
+
+    # Строка proj входит в ключ, поэтому после изменения YAML объекты создаются заново
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _make_crs(zone: str, proj: str) -> CRS:
+        return CRS.from_user_input(proj)
+
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _make_transformer(zone: str, proj: str, target: str) -> Transformer:
+        return Transformer.from_crs(CRSRegistry._make_crs(zone, proj), target, always_xy=True)
+
+
+crs_registry = CRSRegistry("app/msk_params.yaml", "app/msk_regions.yaml")
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .redis_client import get_redis
+
+
+class EventBus:
+    """Рассылка изменений статусов задач через Redis pub/sub.
+
+    События копятся в сессии и публикуются только после commit, поэтому клиенты
+    не видят изменений, которые затем были откачены. Публикация асинхронная и выполняется
+    в transaction после выхода из сессии, а не внутри синхронного обработчика commit.
+    """
+
+    channel = "events"
+    heartbeat = 15  # секунд между служебными сообщениями потока
+
+    @staticmethod
+    def add_task_event(session, task, previous_status: str | None, status: str | None):
+        """Изменение статуса задачи: создание (previous_status=None), удаление (status=None)"""
+        session.info.setdefault("events", []).append(("task", task, previous_status, status))
+
+    @staticmethod
+    def add_group_event(session, group_id: int):
+        """Удаление группы"""
+        session.info.setdefault("events", []).append(("group_deleted", group_id))
+
+    @staticmethod
+    def _serialize(item) -> dict:
+        if item[0] == "group_deleted":
+            return {"type": "group_deleted", "group_id": item[1]}
+
+        _, task, previous_status, status = item
+        # Дата в том же виде, что и в /data/tasks (UTC без часового пояса)
+        created_at = task.created_at.replace(tzinfo=None).isoformat() if task.created_at else None
+        return {
+            "type": "task",
+            "id": task.id,
+            "group_id": task.group_id,
+            "name": task.name,
+            "status": status,
+            "previous_status": previous_status,
+            "error": task.error,
+            "created_at": created_at,
+        }
+
+    async def publish(self, messages: list[dict]):
+        try:
+            # Пачка событий (загрузка, удаление группы) отправляется за один обмен с Redis
+            async with get_redis().pipeline(transaction=False) as pipeline:
+                for message in messages:
+                    pipeline.publish(EventBus.channel, json.dumps(message))
+                await pipeline.execute()
+        except RedisError as e:
+            # События только ускоряют обновление интерфейса, данные уже сохранены в БД
+            print(f"EventBus: Ошибка публикации событий: {e}")
+
+    async def publish_committed(self, session):
+        """Публикация событий, зафиксированных commit в сессии"""
+        messages = session.info.pop("committed_events", None)
+        if messages:
+            await self.publish(messages)
+
+    async def stream(self, is_disconnected):
+        """Поток событий в формате Server-Sent Events"""
+        # Подписка занимает отдельное соединение из пула общего клиента
+        pubsub = get_redis().pubsub()
+        await pubsub.subscribe(EventBus.channel)
+
+        try:
+            yield "retry: 3000\n\n"
+            while not await is_disconnected():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=EventBus.heartbeat)
+                if message is None:
+                    yield ": ping\n\n"
+                else:
+                    yield f"data: {message['data'].decode()}\n\n"
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await pubsub.unsubscribe(EventBus.channel)
+            await pubsub.aclose()
+
+
+event_bus = EventBus()
+
+
+@event.listens_for(Session, "after_commit")
+def commit_session_events(session):
+    # Данные событий снимаются в момент commit: после него объекты могут измениться в той же сессии
+    items = session.info.pop("events", None)
+    if items:
+        session.info.setdefault("committed_events", []).extend(EventBus._serialize(item) for item in items)
+
+
+@event.listens_for(Session, "after_rollback")
+def drop_session_events(session):
+    session.info.pop("events", None)
@@ -0,0 +1,134 @@
+import os
+import time
+import weakref
+
+from .redis_client import get_redis
+
+# Выдача слота: сначала пауза после 429/503, затем лимит одновременных конвертаций, затем token bucket.
+# Возвращает 0, если слот выдан, иначе время ожидания в секундах (строкой: Lua округляет числа в ответе)
+ACQUIRE_SCRIPT = """
+local inflight, bucket, blocked_key, rate_key = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local task_id, now = ARGV[1], tonumber(ARGV[2])
+local max_inflight, max_rate, burst = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local expire_before, wait_inflight = tonumber(ARGV[6]), tonumber(ARGV[7])
+
+redis.call('ZREMRANGEBYSCORE', inflight, '-inf', expire_before)
+if redis.call('ZSCORE', inflight, task_id) then
+    return '0'
+end
+
+local blocked = tonumber(redis.call('GET', blocked_key) or '0')
+if blocked > now then
+    return tostring(blocked - now)
+end
+
+if redis.call('ZCARD', inflight) >= max_inflight then
+    return tostring(wait_inflight)
+end
+
+local rate = tonumber(redis.call('GET', rate_key) or max_rate)
+local tokens = tonumber(redis.call('HGET', bucket, 'tokens') or burst)
+local updated = tonumber(redis.call('HGET', bucket, 'updated') or now)
+tokens = math.min(burst, tokens + (now - updated) * rate)
+
+if tokens < 1 then
+    redis.call('HSET', bucket, 'tokens', tokens, 'updated', now)
+    return tostring((1 - tokens) / rate)
+end
+
+redis.call('HSET', bucket, 'tokens', tokens - 1, 'updated', now)
+redis.call('ZADD', inflight, now, task_id)
+return '0'
+"""
+
+# AIMD: аддитивное увеличение скорости после успешной отправки, кратное снижение при отказе сервера
+ADJUST_SCRIPT = """
+local rate_key, blocked_key = KEYS[1], KEYS[2]
+local max_rate, min_rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local step, factor, blocked_until = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+
+local rate = tonumber(redis.call('GET', rate_key) or max_rate)
+rate = math.max(min_rate, math.min(max_rate, rate * factor + step))
+redis.call('SET', rate_key, rate)
+
+if blocked_until > tonumber(redis.call('GET', blocked_key) or '0') then
+    redis.call('SET', blocked_key, blocked_until)
+end
+return tostring(rate)
+"""
+
+
+class RemoteGovernor:
+    """Общий для всех процессов ограничитель нагрузки на Toolbox (состояние хранится в Redis)"""
+
+    max_inflight = int(os.getenv("GOVERNOR_MAX_INFLIGHT", "20"))  # конвертаций одновременно
+    max_rate = float(os.getenv("GOVERNOR_MAX_RATE", "1"))  # отправок в секунду
+    min_rate = float(os.getenv("GOVERNOR_MIN_RATE", "0.05"))
+    burst = float(os.getenv("GOVERNOR_BURST", "5"))
+    rate_step = max_rate / 20  # прирост скорости после каждой успешной отправки
+    inflight_ttl = 60 * 90  # слот освобождается сам, если задача потеряна (как лимит ожидания в опросе)
+    wait_inflight = 5  # период проверки свободного слота, секунды
+
+    keys = {
+        "inflight": "governor:inflight",
+        "bucket": "governor:bucket",
+        "blocked": "governor:blocked_until",
+        "rate": "governor:rate",
+    }
+
+    def __init__(self):
+        self._scripts = weakref.WeakKeyDictionary()  # redis.asyncio.Redis -> (acquire, adjust)
+
+    def _get_scripts(self):
+        """Скрипты, зарегистрированные в клиенте Redis текущего event loop"""
+        client = get_redis()
+        scripts = self._scripts.get(client)
+        if scripts is None:
+            scripts = (client.register_script(ACQUIRE_SCRIPT), client.register_script(ADJUST_SCRIPT))
+            self._scripts[client] = scripts
+        return scripts
+
+    async def try_acquire(self, task_id: int) -> float:
+        """Попытка занять слот для отправки задачи на конвертацию.
+        Возвращает 0, если слот выдан, иначе время в секундах до следующей попытки"""
+        acquire, _ = self._get_scripts()
+        keys = self.keys
+        now = time.time()
+        wait = await acquire(
+            keys=[keys["inflight"], keys["bucket"], keys["blocked"], keys["rate"]],
+            args=[
+                task_id,
+                now,
+                RemoteGovernor.max_inflight,
+                RemoteGovernor.max_rate,
+                RemoteGovernor.burst,
+                now - RemoteGovernor.inflight_ttl,
+                RemoteGovernor.wait_inflight,
+            ],
+        )
+        return max(float(wait), 0)
+
+    async def release(self, *task_ids: int):
+        """Освобождение слотов завершенных, удаленных или перезапущенных задач"""
+        if task_ids:
+            await get_redis().zrem(self.keys["inflight"], *task_ids)
+
+    async def _adjust_rate(self, factor: float, step: float, blocked_until: float = 0):
+        _, adjust = self._get_scripts()
+        return float(
+            await adjust(
+                keys=[self.keys["rate"], self.keys["blocked"]],
+                args=[RemoteGovernor.max_rate, RemoteGovernor.min_rate, step, factor, blocked_until],
+            )
+        )
+
+    async def on_success(self):
+        await self._adjust_rate(1, RemoteGovernor.rate_step)
+
+    async def on_throttle(self, retry_after: float):
+        """Сервер ответил 429/503: скорость отправки снижается вдвое, все процессы ждут retry_after"""
+        rate = await self._adjust_rate(0.5, 0, time.time() + retry_after)
+        print(f"RemoteGovernor: Сервер ограничил запросы, скорость снижена до {rate:.3f}/с, пауза {retry_after:.0f} с")
+
+
+governor = RemoteGovernor()
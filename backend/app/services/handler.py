@@ -2,10 +2,12 @@ import asyncio
 from uuid import uuid4
 
 from app.models import ProcessingParams
-from app.services.worker import celery, collect_kpt
+from app.services.worker import celery, dispatch_stage, submit_kpt
 
+from .governor import governor
 from .repository import Repository, transaction
 from .uploader import Uploader
+from .work_cycle import pause_manager
 
 
 class Handler:
@@ -14,49 +16,51 @@ class Handler:
     @staticmethod
     async def create_tasks(params: ProcessingParams):
         async with transaction() as session:
-            files = params.files
+            files_info = await asyncio.gather(*[Uploader.upload(file) for file in params.files])
+            files_info = [info for info in files_info if info]
+            options = params.get_params()
+
             if not params.force_add:
-                existing_tasks = await Repository.get_tasks(base_session=session)
-                files = list(
-                    filter(
-                        lambda x: Uploader.get_filename(x.filename) not in [task.name for task in existing_tasks],
-                        files,
-                    )
-                )
-
-            if not files:
+                # Пропускаются только повторно загруженные файлы: то же имя и то же содержимое
+                known = await Repository.get_duplicates([(info[1], info[2]) for info in files_info], session)
+                skipped = [info for info in files_info if (info[1], info[2]) in known]
+                await Uploader.clear_files(*[task_path for task_path, _, _ in skipped])
+                files_info = [info for info in files_info if (info[1], info[2]) not in known]
+
+            if not files_info:
                 raise Exception("Все файлы уже обработаны")
 
-            files_info = await asyncio.gather(*[Uploader.upload(file) for file in files])
+            # Для выписки с тем же содержимым и параметрами берется готовый результат без обращения к Toolbox
+            completed_tasks = await Repository.get_completed_by_hash([info[2] for info in files_info], session)
+            results = {task.source_hash: task.kpt_file for task in completed_tasks if task.options == options}
+
             name = params.name if params.name is not None else files_info[0][1]
-            group = await Repository.create_group(name, session)
+            group = await Repository.create_group(name, session, priority=params.priority)
             await session.commit()
 
-            tasks = await asyncio.gather(
-                *[
-                    Repository.create_task(
-                        session,
-                        name=task_name,
-                        group_id=group.id,
-                        source_file=task_path,
-                        options=params.get_params(),
-                    )
-                    for task_path, task_name in files_info
-                ]
+            kpt_files = await asyncio.gather(
+                *[Uploader.copy_result(results.get(source_hash), file_name) for _, file_name, source_hash in files_info]
+            )
+            tasks = await Repository.create_tasks(
+                [
+                    {
+                        "name": task_name,
+                        "group_id": group.id,
+                        "source_file": task_path,
+                        "source_hash": source_hash,
+                        "options": options,
+                        "kpt_file": kpt_file,
+                        "status": "completed" if kpt_file else None,
+                    }
+                    for (task_path, task_name, source_hash), kpt_file in zip(files_info, kpt_files)
+                ],
+                session,
             )
 
+            # Принятые задачи отправляет в очередь TaskScheduler с учетом приоритета группы
             await session.commit()
-            task_ids = await asyncio.gather(*[Handler.run_task(task.id, task.celery_id) for task in tasks])
 
-            return group.id, task_ids
-
-    @staticmethod
-    async def run_task(task_id: int, celery_id: str):
-        collect_kpt.apply_async(
-            args=(task_id,),
-            task_id=celery_id,
-        )
-        return task_id
+            return group.id, [task.id for task in tasks]
 
     @staticmethod
     async def restart_task(db_id: int, base_session=None, force=False):
@@ -68,26 +72,53 @@ class Handler:
             new_celery_id = str(uuid4())
             await Uploader.clear_file(task.kpt_file)
 
+            # Без force уже запущенная в Toolbox конвертация не повторяется, задача возвращается к опросу статуса
+            task_id = None if force else task.task_id
+            if task_id is None:
+                await governor.release(db_id)
+
             await Repository.update_task(
                 db_id,
                 session,
                 celery_id=new_celery_id,
                 kpt_file=None,
-                task_id=None if force else task.task_id,
-                status="accepted",
+                task_id=task_id,
+                status="accepted" if task_id is None else "converting",
                 error=None,
             )
 
             if base_session is None:
                 await session.commit()
 
-            await Handler.run_task(db_id, new_celery_id)
+    @staticmethod
+    async def resume_task(db_id: int):
+        """Продолжение задачи с этапа, на котором она была прервана"""
+        task = await Repository.get_task(db_id)
+        if task.status == "accepted":
+            # Задача еще не отправлена в очередь, ее отправит TaskScheduler
+            return
+
+        celery.control.revoke(task.celery_id, terminate=True)
+        print("Возобновление задачи", db_id, "со статусом", task.status)
+
+        if task.status == "uploading":
+            await dispatch_stage(submit_kpt, db_id)
+        elif task.status in ("converting", "downloading", "postprocessing") and task.task_id:
+            # Результат скачивается заново: прерванная постобработка могла частично изменить файл
+            await Uploader.clear_file(task.kpt_file)
+            await Repository.update_task(db_id, None, kpt_file=None, status="converting")
+        else:
+            await Handler.restart_task(db_id, force=True)
 
     @staticmethod
     async def restart_group(group_id: int):
         async with transaction() as session:
             tasks = await Repository.get_tasks(group_id, session)
-            await asyncio.gather(*[Handler.restart_task(task.id, session, force=True) for task in tasks])
+            celery.control.revoke([task.celery_id for task in tasks], terminate=True)
+            await governor.release(*[task.id for task in tasks])
+            await Uploader.clear_files(*[task.kpt_file for task in tasks])
+
+            await Repository.update_tasks(tasks, session, kpt_file=None, task_id=None, status="accepted", error=None)
             await session.commit()
 
     @staticmethod
@@ -95,6 +126,7 @@ class Handler:
         async with transaction(base_session) as session:
             task = await Repository.delete_task(task_id, session)
             celery.control.revoke(task.celery_id, terminate=True)
+            await governor.release(task_id)
             await Uploader.clear_files(task.source_file, task.kpt_file)
 
             if base_session is None:
@@ -103,21 +135,43 @@ class Handler:
     @staticmethod
     async def delete_group(group_id: int):
         async with transaction() as session:
-            tasks = await Repository.get_tasks(group_id, session)
-            await asyncio.gather(*[Handler.delete_task(task.id, session) for task in tasks])
-            await Repository.delete_group(group_id, session)
+            _, tasks = await Repository.delete_group(group_id, session)
             await session.commit()
 
+        celery.control.revoke([task.celery_id for task in tasks], terminate=True)
+        await governor.release(*[task.id for task in tasks])
+        await Uploader.clear_files(*[path for task in tasks for path in (task.source_file, task.kpt_file)])
+
     @staticmethod
     async def restart_working_tasks():
         async with transaction() as session:
-            tasks = await Repository.get_working_tasks(session)
-            await asyncio.gather(*[Handler.restart_task(task.id, session) for task in tasks])
-            await session.commit()
+            tasks = (await Repository.get_working_tasks(session)).all()
+
+        for task in tasks:
+            await Handler.resume_task(task.id)
+
+    @staticmethod
+    async def set_priority(group_id: int, priority: int):
+        group = await Repository.set_group_priority(group_id, priority)
+        if group is None:
+            raise Exception("Группа не найдена")
+
+    @staticmethod
+    async def pause():
+        """Пауза обработки: worker перестают получать задачи, очереди остаются в брокере"""
+        await pause_manager.set_pause()
+        celery.control.broadcast("pause_consumers")
+
+    @staticmethod
+    async def resume():
+        await pause_manager.unset_pause()
+        celery.control.broadcast("resume_consumers")
 
     @staticmethod
     async def download_group(group_id: int):
+        """Название группы и поток архива с результатами ее задач"""
         async with transaction() as session:
+            group = await Repository.get_group(group_id, session)
             tasks = await Repository.get_tasks(group_id, session)
             paths = [task.kpt_file for task in tasks if task.kpt_file]
-            return await Uploader.zip_files(paths)
+            return group["name"], Uploader.stream_zip(paths)
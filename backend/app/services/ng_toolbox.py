@@ -1,7 +1,16 @@
+import asyncio
 import os
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from importlib.util import find_spec
+from typing import AsyncIterator, Callable
 
-import requests
-from requests.exceptions import RequestException, Timeout
+import aiofiles
+import aiofiles.os as aos
+import httpx
+
+from .governor import governor
 
 
 class NGToolbox:
@@ -14,52 +23,172 @@ class NGToolbox:
     api_key = os.getenv("NGT_API_KEY")
     headers = {"Authorization": "Token " + token}
 
+    # Пул соединений с keep-alive, HTTP/2 включается при установленном пакете h2
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("NGT_MAX_CONNECTIONS", "10")),
+        max_keepalive_connections=int(os.getenv("NGT_MAX_CONNECTIONS", "10")),
+        keepalive_expiry=float(os.getenv("NGT_KEEPALIVE_EXPIRY", "60")),
+    )
+    http2 = find_spec("h2") is not None
+    chunk_size = 1024 * 1024  # 1 MB
+    progress_interval = 10  # секунд между сообщениями о ходе передачи
+
+    # Ответы перегруженного сервера, после которых запрос повторяется
+    retry_statuses = {429, 502, 503, 504}
+    # POST (загрузка, запуск конвертации) не идемпотентен: после 502/504 от прокси или таймаута ответа
+    # сервер мог уже принять запрос, повтор создал бы задачу в Toolbox повторно
+    post_retry_statuses = {429, 503}
+    throttle_statuses = {429, 503}
+    max_retry_after = 60 * 10
+
+    _clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
     @staticmethod
-    def make_request(
+    def _get_client() -> httpx.AsyncClient:
+        """Общий клиент для текущего event loop (клиент httpx нельзя использовать в другом loop)"""
+        loop = asyncio.get_running_loop()
+        client = NGToolbox._clients.get(loop)
+
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                headers=NGToolbox.headers,
+                verify=False,
+                http2=NGToolbox.http2,
+                limits=NGToolbox.limits,
+            )
+            NGToolbox._clients[loop] = client
+
+        return client
+
+    @staticmethod
+    async def aclose():
+        """Закрытие соединений клиента текущего event loop"""
+        client = NGToolbox._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    @staticmethod
+    async def make_request(
         url,
         req_type="get",
-        data=None,
+        content: bytes | Callable[[], AsyncIterator[bytes]] | None = None,
         json=None,
         params=None,
+        headers=None,
         timeout=30,
         max_attempts=5,
     ):
+        idempotent = req_type.lower() != "post"
+        retry_statuses = NGToolbox.retry_statuses if idempotent else NGToolbox.post_retry_statuses
+
         attempt = 0
         while attempt < max_attempts:
             try:
-                response = requests.request(
+                response = await NGToolbox._get_client().request(
                     req_type,
                     url,
-                    data=data,
+                    # Поток данных не может быть прочитан повторно, поэтому создается на каждую попытку
+                    content=content() if callable(content) else content,
                     params=params,
                     json=json,
-                    headers=NGToolbox.headers,
-                    verify=False,
+                    headers=headers,
                     timeout=timeout,
                 )
 
                 response.raise_for_status()
                 return response
-            except Timeout:
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # Запрос не был отправлен, повтор безопасен для любого метода
+                print(f"Попытка {attempt + 1} из {max_attempts}. Нет соединения с сервером: {e!r}")
+                await asyncio.sleep(NGToolbox._get_retry_after(None, attempt))
+                attempt += 1
+            except httpx.TimeoutException as e:
+                if not idempotent:
+                    raise Exception(f"TaskUploader (make_request): Время ожидания ответа сервера истекло:<br>{e!r}")
+
                 print(f"Попытка {attempt + 1} из {max_attempts}. Время ожидания ответа истекло.")
                 attempt += 1
-            except RequestException as e:
+            except httpx.HTTPStatusError as e:
+                status_code = e.response.status_code
+                if status_code not in retry_statuses:
+                    raise Exception(f"TaskUploader (make_request): Ошибка при выполнении запроса к серверу:<br>{e}")
+
+                retry_after = NGToolbox._get_retry_after(e.response, attempt)
+                if status_code in NGToolbox.throttle_statuses:
+                    await governor.on_throttle(retry_after)
+
+                print(f"Попытка {attempt + 1} из {max_attempts}. Сервер ответил {status_code}.")
+                print(f"Повтор запроса через {retry_after:.0f} с")
+                await asyncio.sleep(retry_after)
+                attempt += 1
+            except httpx.HTTPError as e:
                 raise Exception(f"TaskUploader (make_request): Ошибка при выполнении запроса к серверу:<br>{e}")
 
         raise Exception(f"TaskUploader (make_request): Превышено количество запросов к серверу ({max_attempts})")
 
     @staticmethod
-    def upload(upload_file):
+    def _get_retry_after(response: httpx.Response | None, attempt: int) -> float:
+        """Задержка из заголовка Retry-After (секунды или дата), иначе экспоненциальная"""
+        delay = min(5 * 2**attempt, NGToolbox.max_retry_after)
+        header = response.headers.get("Retry-After") if response is not None else None
+
+        if header:
+            try:
+                delay = float(header)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(header).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+
+        return min(max(delay, 1), NGToolbox.max_retry_after)
+
+    @staticmethod
+    def _log_progress(action: str, done: int, total: int | None, started: float, offset: int = 0):
+        """Вывод объема переданных данных и скорости передачи (offset - уже переданное до попытки)"""
+        speed = (done - offset) / max(time.monotonic() - started, 1e-6) / 1024 / 1024
+        message = f"{action}: {done / 1024 / 1024:.1f}"
+        if total:
+            message += f" из {total / 1024 / 1024:.1f} MB ({done * 100 // total}%)"
+        else:
+            message += " MB"
+        print(f"{message}, {speed:.1f} MB/s")
+
+    @staticmethod
+    async def _read_file(file_path, total: int) -> AsyncIterator[bytes]:
+        started = last_report = time.monotonic()
+        done = 0
+
+        async with aiofiles.open(file_path, "rb") as f:
+            while chunk := await f.read(NGToolbox.chunk_size):
+                yield chunk
+                done += len(chunk)
+
+                if time.monotonic() - last_report >= NGToolbox.progress_interval:
+                    NGToolbox._log_progress("Загрузка", done, total, started)
+                    last_report = time.monotonic()
+
+        NGToolbox._log_progress("Загрузка завершена", done, total, started)
+
+    @staticmethod
+    async def upload(upload_file):
+        # API загрузки не поддерживает докачку, поэтому повторная попытка отправляет файл с начала
         try:
-            with open(upload_file, "rb") as f:
-                url = NGToolbox.upload_url + os.path.basename(upload_file)
-                response = NGToolbox.make_request(url, req_type="post", data=f)
-                return response.text  # id файла на сервере
+            url = NGToolbox.upload_url + os.path.basename(upload_file)
+            size = os.path.getsize(upload_file)
+            response = await NGToolbox.make_request(
+                url,
+                req_type="post",
+                content=lambda: NGToolbox._read_file(upload_file, size),
+                headers={"Content-Length": str(size)},
+                timeout=httpx.Timeout(30, write=300),
+            )
+            return response.text  # id файла на сервере
         except Exception as e:
             raise Exception("NGToolbox (upload): Ошибка при загрузке файла на сервер:<br>", e)
 
     @staticmethod
-    def collect_kpt(file_id, identifier="kpt", **kwargs):
+    async def collect_kpt(file_id, identifier="kpt", **kwargs):
         if not file_id:
             raise Exception("NGToolbox (collect_kpt): Не указан ID файла для получения списка кварталов")
 
@@ -73,24 +202,86 @@ class NGToolbox:
         json_request["inputs"]["remove_empty_attributes"] = kwargs.get("remove_empty_attrs", False)
         json_request["inputs"]["parse_reestr_extract"] = kwargs.get("convert_additional_data", False)
 
-        response = NGToolbox.make_request(NGToolbox.execute_url, req_type="post", json=json_request)
+        response = await NGToolbox.make_request(NGToolbox.execute_url, req_type="post", json=json_request)
         task_id = response.json()["task_id"]
         return task_id  # id задачи на сервере
 
     @staticmethod
-    def status(task_id):
+    async def status(task_id):
         if not task_id:
             raise Exception("NGToolbox (status): Не указан ID задачи для получения статуса")
 
-        response = NGToolbox.make_request(NGToolbox.status_url + task_id + "/")
+        response = await NGToolbox.make_request(NGToolbox.status_url + task_id + "/")
         response_data = response.json()
         response_data["task_id"] = task_id
         return response_data
 
     @staticmethod
-    def download(file_url):
+    async def _stream_to_file(file_url, file, offset: int, timeout) -> int:
+        """Запись ответа в файл по частям; при offset запрашивается продолжение файла"""
+        # Без сжатия на лету, чтобы смещение Range совпадало с записанными байтами
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        async with NGToolbox._get_client().stream("GET", file_url, headers=headers, timeout=timeout) as response:
+            response.raise_for_status()
+
+            if offset and response.status_code != 206:
+                print("Сервер не поддерживает докачку, файл скачивается заново")
+                offset = 0
+                await file.seek(0)
+                await file.truncate()
+
+            length = response.headers.get("Content-Length")
+            total = offset + int(length) if length else None
+            started = last_report = time.monotonic()
+            done = offset
+
+            async for chunk in response.aiter_raw(NGToolbox.chunk_size):
+                await file.write(chunk)
+                done += len(chunk)
+
+                if time.monotonic() - last_report >= NGToolbox.progress_interval:
+                    NGToolbox._log_progress("Скачивание", done, total, started, offset)
+                    last_report = time.monotonic()
+
+            NGToolbox._log_progress("Скачивание завершено", done, total, started, offset)
+            return done
+
+    @staticmethod
+    async def download(file_url, file_path, timeout=30, max_attempts=5):
+        """Скачивание файла по частям сразу на диск, с докачкой после обрыва соединения"""
         if not file_url:
             raise Exception("NGToolbox (download): Не указан URL файла для скачивания")
 
-        response = NGToolbox.make_request(file_url)
-        return response.content
+        part_path = file_path + ".part"
+        offset = 0
+        attempt = 0
+
+        try:
+            async with aiofiles.open(part_path, "wb") as f:
+                while True:
+                    try:
+                        await NGToolbox._stream_to_file(file_url, f, offset, timeout)
+                        break
+                    except httpx.TransportError as e:
+                        attempt += 1
+                        if attempt >= max_attempts:
+                            raise Exception(
+                                f"NGToolbox (download): Превышено количество запросов к серверу ({max_attempts})"
+                            )
+
+                        await f.flush()
+                        offset = await f.tell()
+                        print(f"Попытка {attempt + 1} из {max_attempts}. Обрыв скачивания: {e!r}")
+                        print(f"Продолжение скачивания с {offset} байт")
+                    except httpx.HTTPError as e:
+                        raise Exception(f"NGToolbox (download): Ошибка при скачивании файла:<br>{e}")
+
+            await aos.replace(part_path, file_path)
+            return file_path
+        except BaseException:
+            if await aos.path.exists(part_path):
+                await aos.remove(part_path)
+            raise
@@ -1,38 +1,233 @@
+import copy
+import glob
+import io
+import os
 import re
+import shutil
+import struct
 import tempfile
 import zipfile
-from pathlib import Path
-from typing import Callable
+from fnmatch import fnmatchcase
+from functools import partial
+from importlib.util import find_spec
+from pathlib import Path, PurePosixPath
+from typing import IO, Callable
 from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
 
 import geopandas as gpd
-import yaml
+import numpy as np
+import pandas as pd
+import pyogrio
+import shapely
+from billiard.pool import Pool
+
+from app.models import ProcessingFormat
+
+from .crs_registry import crs_registry
 
 
 class Parser:
+    chunk_size = 1024 * 1024
+
+    # Локальный заголовок файла в архиве: сигнатура, поля фиксированной длины, длины имени и доп. поля
+    local_header = struct.Struct("<4s22xHH")
+    local_header_signature = b"PK\x03\x04"
+
+    # Число процессов для параллельной обработки файлов архива (1 - последовательно)
+    workers = int(os.getenv("PARSER_WORKERS", "1"))
+    _pool = None
+    _pool_pid = None
+
+    @staticmethod
+    def _get_pool() -> Pool:
+        """Пул процессов создаётся один раз на процесс воркера и переиспользуется между задачами"""
+        if Parser._pool is None or Parser._pool_pid != os.getpid():
+            Parser._pool = Pool(Parser.workers)
+            Parser._pool_pid = os.getpid()
+        return Parser._pool
+
     @staticmethod
-    def extract_for_parsing(arc_path: str, parsing_func: Callable):
-        """Создание временной директории для обработки файлов из архива"""
+    def close_pool():
+        if Parser._pool is not None and Parser._pool_pid == os.getpid():
+            Parser._pool.close()
+            Parser._pool.join()
+        Parser._pool = None
+        Parser._pool_pid = None
+
+    @staticmethod
+    def _map(func: Callable, items: list[tuple]) -> list:
+        if Parser.workers <= 1 or len(items) <= 1:
+            return [func(*args) for args in items]
+        return Parser._get_pool().starmap(func, items)
+
+    @staticmethod
+    def _copy_raw_member(source: zipfile.ZipFile, target: zipfile.ZipFile, info: zipfile.ZipInfo):
+        """Перенос сжатых данных файла из архива в архив без распаковки.
+
+        У zipfile нет публичного API для копирования без перепаковки: заголовок пишется через
+        ZipInfo.FileHeader(), запись в target повторяет ZipFile.write (fp, filelist, NameToInfo, start_dir).
+        Совместимость проверяется тестом tests/test_archive.py.
+        """
+        if max(info.file_size, info.compress_size, info.header_offset) >= zipfile.ZIP64_LIMIT:
+            with source.open(info) as src, target.open(info.filename, "w", force_zip64=True) as dst:
+                shutil.copyfileobj(src, dst, Parser.chunk_size)
+            return
+
+        source.fp.seek(info.header_offset)
+        signature, name_length, extra_length = Parser.local_header.unpack(source.fp.read(Parser.local_header.size))
+        if signature != Parser.local_header_signature:
+            raise zipfile.BadZipFile(f"Parser: Некорректный заголовок файла '{info.filename}' в архиве")
+        source.fp.seek(name_length + extra_length, os.SEEK_CUR)
+
+        new_info = copy.copy(info)
+        new_info.header_offset = target.fp.tell()
+        new_info.flag_bits &= ~0x08  # размеры и CRC пишутся в заголовок, дескриптор данных не нужен
+        target.fp.write(new_info.FileHeader())
+
+        remaining = info.compress_size
+        while remaining:
+            chunk = source.fp.read(min(remaining, Parser.chunk_size))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Parser: Неожиданный конец файла '{info.filename}' в архиве")
+            target.fp.write(chunk)
+            remaining -= len(chunk)
+
+        target.filelist.append(new_info)
+        target.NameToInfo[new_info.filename] = new_info
+        target.start_dir = target.fp.tell()
+
+    @staticmethod
+    def _replace_archive(arc_path: str, build_func: Callable[[zipfile.ZipFile, zipfile.ZipFile], None]):
+        tmp_path = f"{arc_path}.tmp"
+        try:
+            with (
+                zipfile.ZipFile(arc_path, "r") as source,
+                zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as target,
+            ):
+                build_func(source, target)
+            os.replace(tmp_path, arc_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _rewrite_member(
+        source: zipfile.ZipFile,
+        target: zipfile.ZipFile,
+        info: zipfile.ZipInfo,
+        rewrite_func: Callable[[IO[bytes], IO[bytes]], None],
+    ):
+        new_info = zipfile.ZipInfo(info.filename, info.date_time)
+        new_info.compress_type = zipfile.ZIP_DEFLATED
+        new_info.external_attr = info.external_attr
+        force_zip64 = info.file_size > zipfile.ZIP64_LIMIT // 2
+
+        with source.open(info) as src, target.open(new_info, "w", force_zip64=force_zip64) as dst:
+            rewrite_func(src, dst)
+
+    @staticmethod
+    def _rewrite_member_to_part(
+        arc_path: str,
+        index: int,
+        rewrite_func: Callable[[IO[bytes], IO[bytes]], None],
+        part_path: str,
+    ):
+        """Перезапись одного файла архива в отдельный архив (выполняется в пуле процессов)"""
+        with zipfile.ZipFile(arc_path, "r") as source, zipfile.ZipFile(part_path, "w", zipfile.ZIP_DEFLATED) as target:
+            Parser._rewrite_member(source, target, source.infolist()[index], rewrite_func)
+
+    @staticmethod
+    def rewrite_archive(
+        arc_path: str,
+        member_filter: Callable[[str], bool],
+        rewrite_func: Callable[[IO[bytes], IO[bytes]], None],
+    ):
+        """Потоковая перезапись отобранных файлов архива, остальные копируются без перепаковки.
+
+        При нескольких процессах (PARSER_WORKERS) файлы обрабатываются параллельно,
+        rewrite_func при этом должна сериализоваться через pickle.
+        """
+        with zipfile.ZipFile(arc_path, "r") as archive:
+            selected = {
+                index
+                for index, info in enumerate(archive.infolist())
+                if not info.is_dir() and member_filter(info.filename)
+            }
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            parts = {}
+            if Parser.workers > 1 and len(selected) > 1:
+                parts = {index: os.path.join(tmp_dir, f"{index}.zip") for index in sorted(selected)}
+                Parser._map(
+                    Parser._rewrite_member_to_part,
+                    [(arc_path, index, rewrite_func, part_path) for index, part_path in parts.items()],
+                )
+
+            def build(source: zipfile.ZipFile, target: zipfile.ZipFile):
+                for index, info in enumerate(source.infolist()):
+                    if index in parts:
+                        with zipfile.ZipFile(parts[index], "r") as part:
+                            Parser._copy_raw_member(part, target, part.infolist()[0])
+                    elif index in selected:
+                        Parser._rewrite_member(source, target, info, rewrite_func)
+                    else:
+                        Parser._copy_raw_member(source, target, info)
+
+            Parser._replace_archive(arc_path, build)
+
+    @staticmethod
+    def patch_archive(arc_path: str, member_filter: Callable[[str], bool], parsing_func: Callable[[str], None]):
+        """Обработка во временной директории только отобранных файлов архива"""
         with tempfile.TemporaryDirectory() as tmp_dir:
             with zipfile.ZipFile(arc_path, "r") as archive:
-                archive.extractall(tmp_dir)
+                members = [info for info in archive.infolist() if not info.is_dir() and member_filter(info.filename)]
+                if not members:
+                    return
+                archive.extractall(tmp_dir, members)
 
             # Вызов функции обработки файлов
             parsing_func(tmp_dir)
 
-            with zipfile.ZipFile(arc_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            def build(source: zipfile.ZipFile, target: zipfile.ZipFile):
+                written = set()
+                for info in source.infolist():
+                    if info.is_dir() or not member_filter(info.filename):
+                        Parser._copy_raw_member(source, target, info)
+                    elif (file := Path(tmp_dir, info.filename)).is_file():
+                        target.write(file, info.filename)
+                        written.add(info.filename)
+
+                # Файлы, созданные при обработке
                 for file in Path(tmp_dir).rglob("*"):
-                    if file.is_file():
-                        archive.write(file, file.relative_to(tmp_dir))
+                    arcname = file.relative_to(tmp_dir).as_posix()
+                    if file.is_file() and arcname not in written:
+                        target.write(file, arcname)
 
-    @staticmethod
-    def _load_crs_params(yaml_path: str):
-        with open(yaml_path) as file:
-            crs_params = yaml.safe_load(file)
-        return crs_params
+            Parser._replace_archive(arc_path, build)
 
 
 class XMLParser(Parser):
+    records = frozenset(
+        {
+            "subject_boundary_record",
+            "municipal_boundary_record",
+            "inhabited_locality_boundary_record",
+            "coastline_record",
+            "zones_and_territories_record",
+            "land_record",
+            "build_record",
+            "construction_record",
+            "object_under_construction_record",
+        }
+    )
+
+    # Классы ординат: 7-значная 'y', перепутанные 'x'/'y', 6-значные 'x' и 'y', ошибка
+    ORD_VALID, ORD_SWAPPED, ORD_SHORT, ORD_INVALID = range(4)
+
+    # Потоковая обработка XML (память ограничена размером одной записи)
+    streaming = os.getenv("XML_PARSER_STREAMING", "true").lower() == "true"
+
     @staticmethod
     def _extract_cad_region(cad_number: str) -> str:
         numbers = re.findall(r"\d+", cad_number)
@@ -53,6 +248,30 @@ class XMLParser(Parser):
 
         return f"{region_code}:{district_code}"
 
+    @staticmethod
+    def _int_part_len(coords: np.ndarray) -> np.ndarray:
+        dot_pos = np.char.find(coords, ".")
+        return np.where(dot_pos < 0, np.char.str_len(coords), dot_pos)
+
+    @staticmethod
+    def _classify_ordinates(y_coords: np.ndarray, x_coords: np.ndarray) -> np.ndarray:
+        """Классификация ординат по длине целой части координат"""
+        y_len = XMLParser._int_part_len(y_coords)
+        x_len = XMLParser._int_part_len(x_coords)
+
+        classes = np.full(len(y_len), XMLParser.ORD_INVALID)
+        classes[(y_len == 6) & (x_len == 6)] = XMLParser.ORD_SHORT
+        classes[(y_len == 6) & (x_len == 7)] = XMLParser.ORD_SWAPPED
+        classes[y_len == 7] = XMLParser.ORD_VALID
+        return classes
+
+    @staticmethod
+    def _iter_ordinates(elem: ET.Element):
+        for ordinate in elem.iter("ordinate"):
+            y_elem, x_elem = ordinate.find("y"), ordinate.find("x")
+            if y_elem is not None and x_elem is not None:
+                yield y_elem, x_elem
+
     @staticmethod
     def _fix_elem_sk(elem: ET.Element, crs_params: dict, cad_region: str):
         sk_id_elem = elem.find("sk_id")
@@ -61,134 +280,400 @@ class XMLParser(Parser):
             sk_id_elem = ET.SubElement(elem, "sk_id")
         sk_id = None
 
-        def swap_coords(x, y):
-            return y, x
+        ordinates = XMLParser._iter_ordinates(elem)
+        first = next(ordinates, None)
+
+        # Частый случай: первая ордината корректна, остальные не проверяются
+        if first is not None and len((first[0].text or "").partition(".")[0]) == 7:
+            sk_id_elem.text = f"{cad_region[:2]}.{first[0].text[:1]}"
+            return
+
+        if first is not None:
+            ordinates = [first, *ordinates]
+            y_coords = np.array([y_elem.text or "" for y_elem, _ in ordinates], dtype=str)
+            x_coords = np.array([x_elem.text or "" for _, x_elem in ordinates], dtype=str)
+            classes = XMLParser._classify_ordinates(y_coords, x_coords)
+
+            # Проверка идёт до первой корректной или ошибочной ординаты
+            stops = np.flatnonzero((classes == XMLParser.ORD_VALID) | (classes == XMLParser.ORD_INVALID))
+            end = stops[0] if len(stops) else len(classes)
+
+            swapped_count = np.count_nonzero(classes[:end] == XMLParser.ORD_SWAPPED)
+            short_idx = np.flatnonzero(classes[:end] == XMLParser.ORD_SHORT)
+
+            if len(short_idx):
+                crs_id = crs_params.get(cad_region)
+                if not crs_id:
+                    raise ValueError(f"XMLParser: Параметры CRS для региона '{cad_region}' не найдены")
+
+                fixed_y = np.char.add(crs_id[-1], y_coords[short_idx]).tolist()
+                for i, y_coord in zip(short_idx.tolist(), fixed_y):
+                    ordinates[i][0].text = y_coord
+
+            if end:
+                sk_id = crs_id if classes[0] == XMLParser.ORD_SHORT else f"{cad_region[:2]}.{x_coords[0][:1]}"
+
+            has_error = end < len(classes) and classes[end] == XMLParser.ORD_INVALID
+            if has_error:
+                sk_id = "Ошибка в координатах"
+            elif end < len(classes):
+                sk_id = f"{cad_region[:2]}.{y_coords[end][:1]}"
+
+            if swapped_count or len(short_idx) or has_error:
+                print(
+                    f"XMLParser: '{cad_region}' ({len(ordinates)} ординат): "
+                    f"замена координат местами - {swapped_count}, "
+                    f"исправление 6-значных координат - {len(short_idx)}, "
+                    f"ошибка в координатах - {'да' if has_error else 'нет'}"
+                )
 
-        for ordinate in elem.findall(".//ordinate"):
-            y_elem = ordinate.find("y")
-            x_elem = ordinate.find("x")
+        sk_id_elem.text = sk_id
 
-            if y_elem is not None and x_elem is not None:
-                y_coord, x_coord = y_elem.text, x_elem.text
-                y_int_part, x_int_part = y_coord.split(".")[0], x_coord.split(".")[0]
-
-                if len(y_int_part) != 7:
-                    if len(y_int_part) == 6 and len(x_int_part) == 7:
-                        print("XMLParser: Замена координат местами")
-                        y_elem.text, x_elem.text = swap_coords(x_coord, y_coord)
-                        sk_id = sk_id or f"{cad_region[:2]}.{x_coord[:1]}"
-
-                    elif len(y_int_part) == 6 and len(x_int_part) == 6:
-                        print("XMLParser: Исправление 6-значных координат")
-                        crs_id = crs_params.get(cad_region)
-                        if crs_id:
-                            y_elem.text = f"{crs_id[-1]}{y_coord}"
-                            sk_id = sk_id or crs_id
-                        else:
-                            raise ValueError(f"XMLParser: Параметры CRS для региона '{cad_region}' не найдены")
-                    else:
-                        print("XMLParser: Обнаружена ошибка в координатах")
-                        sk_id = "Ошибка в координатах"
-                        break
-                else:
-                    sk_id = f"{cad_region[:2]}.{y_elem.text[:1]}"
-                    break
+    @staticmethod
+    def _get_record_region(record_element: ET.Element) -> str:
+        cad_number_elem = record_element.find(".//cad_number")
+        if cad_number_elem is None:
+            cad_number_elem = record_element.find(".//reg_numb_border")
 
-        sk_id_elem.text = sk_id
+        return XMLParser._extract_cad_region(cad_number_elem.text)
 
     @staticmethod
-    def _fix_cadastral_blocks(root: ET.Element, crs_params: dict):
-        for cadastral_block_element in root.findall(".//cadastral_block"):
-            cadastral_number_elem = cadastral_block_element.find("cadastral_number")
-            cad_region = XMLParser._extract_cad_region(cadastral_number_elem.text)
+    def _fix_tree(root: ET.Element, crs_params: dict):
+        """Исправление координат за один обход дерева.
+
+        Регион берётся из ближайшей записи, а вне записей - из квартала
+        (только для 'spatial_data/entity_spatial'). Внутрь 'entity_spatial' обход не спускается.
+        """
+        stack = [(root, None, None, False)]  # элемент, тег родителя, регион, внутри записи
+
+        while stack:
+            elem, parent_tag, cad_region, in_record = stack.pop()
+            tag = elem.tag
+
+            if tag == "entity_spatial":
+                if in_record or (cad_region is not None and parent_tag == "spatial_data"):
+                    XMLParser._fix_elem_sk(elem, crs_params, cad_region)
+                continue
 
-            for entity_spatial in cadastral_block_element.findall(".//spatial_data/entity_spatial"):
-                XMLParser._fix_elem_sk(entity_spatial, crs_params, cad_region)
+            if tag in XMLParser.records:
+                cad_region, in_record = XMLParser._get_record_region(elem), True
+            elif tag == "cadastral_block":
+                cad_region = XMLParser._extract_cad_region(elem.find("cadastral_number").text)
+
+            stack.extend((child, tag, cad_region, in_record) for child in reversed(elem))
 
     @staticmethod
-    def _fix_records(root: ET.Element, crs_params: dict, record_name: str):
-        for record_element in root.findall(f".//{record_name}"):
-            cad_number_elem = record_element.find(".//cad_number")
-            if cad_number_elem is None:
-                cad_number_elem = record_element.find(".//reg_numb_border")
+    def _fix_xml_sk(source: IO[bytes], destination: IO[bytes], crs_params: dict):
+        tree = ET.parse(source)
+        XMLParser._fix_tree(tree.getroot(), crs_params)
+        tree.write(destination, encoding="utf-8", xml_declaration=True)
 
-            cad_region = XMLParser._extract_cad_region(cad_number_elem.text)
+    @staticmethod
+    def _is_stream_unit(elem: ET.Element, stack: list[ET.Element]) -> bool:
+        if elem.tag in XMLParser.records:
+            return True
+        if elem.tag == "entity_spatial" and stack and stack[-1].tag == "spatial_data":
+            return any(parent.tag == "cadastral_block" for parent in stack)
+        return False
 
-            for entity_spatial in record_element.findall(".//entity_spatial"):
-                XMLParser._fix_elem_sk(entity_spatial, crs_params, cad_region)
+    @staticmethod
+    def _fix_stream_unit(elem: ET.Element, crs_params: dict, cad_region: str | None):
+        if elem.tag == "entity_spatial":
+            if cad_region is None:
+                raise ValueError("XMLParser: Не найден кадастровый номер квартала")
+            XMLParser._fix_elem_sk(elem, crs_params, cad_region)
+        else:
+            XMLParser._fix_tree(elem, crs_params)
 
     @staticmethod
-    def _fix_xml_sk(file_path: str, crs_params: dict):
-        tree = ET.parse(file_path)
-        root = tree.getroot()
+    def _open_scope(scope: dict, declarations) -> dict:
+        """Пространства имен, видимые в элементе: префикс -> uri"""
+        return {**scope, **dict(declarations)} if declarations else scope
 
-        records = [
-            "subject_boundary_record",
-            "municipal_boundary_record",
-            "inhabited_locality_boundary_record",
-            "coastline_record",
-            "zones_and_territories_record",
-            "land_record",
-            "build_record",
-            "construction_record",
-            "object_under_construction_record",
-        ]
+    @staticmethod
+    def _qualify(name: str, scope: dict, attribute: bool = False) -> str:
+        """Имя {uri}local из ElementTree в виде prefix:local по объявлениям в области видимости"""
+        if not name.startswith("{"):
+            return name
 
-        XMLParser._fix_cadastral_blocks(root, crs_params)
+        uri, local = name[1:].split("}", 1)
+        for prefix in reversed(scope):
+            # Атрибут без префикса не входит в пространство имен по умолчанию
+            if scope[prefix] == uri and (prefix or not attribute):
+                return f"{prefix}:{local}" if prefix else local
 
-        for record in records:
-            XMLParser._fix_records(root, crs_params, record)
+        raise ValueError(f"XMLParser: Не объявлен префикс для пространства имен '{uri}'")
 
-        tree.write(file_path, encoding="utf-8", xml_declaration=True)
+    @staticmethod
+    def _start_tag(elem: ET.Element, scope: dict, declarations) -> str:
+        parts = [XMLParser._qualify(elem.tag, scope)]
+        for prefix, uri in declarations or ():
+            parts.append(f"{'xmlns:' + prefix if prefix else 'xmlns'}={quoteattr(uri)}")
+        for key, value in elem.items():
+            parts.append(f"{XMLParser._qualify(key, scope, attribute=True)}={quoteattr(value)}")
+        return " ".join(parts)
 
     @staticmethod
-    def _start_fix_process(directory_path):
-        report_files = [str(file.resolve()) for file in Path(directory_path).rglob("report*.xml")]
-        crs_params = XMLParser._load_crs_params("app/msk_regions.yaml")
+    def _write_element(write: Callable[[str], int], elem: ET.Element, scope: dict, namespaces: dict):
+        declarations = namespaces.pop(elem, None)
+        scope = XMLParser._open_scope(scope, declarations)
+        start_tag = XMLParser._start_tag(elem, scope, declarations)
+
+        if elem.text or len(elem):
+            write(f"<{start_tag}>")
+            if elem.text:
+                write(escape(elem.text))
+            for child in elem:
+                XMLParser._write_element(write, child, scope, namespaces)
+                if child.tail:
+                    write(escape(child.tail))
+            write(f"</{XMLParser._qualify(elem.tag, scope)}>")
+        else:
+            write(f"<{start_tag} />")
+
+    @staticmethod
+    def _fix_xml_sk_stream(source: IO[bytes], destination: IO[bytes], crs_params: dict):
+        """Потоковое исправление координат из source в destination.
+
+        Элементы вне записей сразу передаются в выходной поток, в памяти собирается
+        только текущая запись (или пространственный элемент квартала).
+        """
+        out = io.TextIOWrapper(destination, encoding="utf-8", newline="\n")
+        out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+
+        stack = []  # открытые элементы, начальные теги которых уже записаны
+        scopes = [{"xml": "http://www.w3.org/XML/1998/namespace"}]  # пространства имен открытых элементов
+        namespaces = {}  # элемент -> объявленные в нем пространства имен (префикс, uri)
+        declarations = []  # объявления перед следующим начальным тегом
+        pending = None  # элемент, чей текст (или хвост) ещё не записан
+        pending_tail = False
+        unit = None  # запись, собираемая в памяти целиком
+        depth = 0
+        cad_region = None
+
+        for event, elem in ET.iterparse(source, events=("start-ns", "start", "end")):
+            if event == "start-ns":
+                declarations.append(elem)
+                continue
+            if event == "start" and declarations:
+                namespaces[elem], declarations = declarations, []
+
+            if unit is not None:
+                depth += 1 if event == "start" else -1
+                if depth:
+                    continue
+
+            # К следующему событию текст/хвост предыдущего элемента прочитан полностью
+            if pending is not None:
+                if not pending_tail:
+                    if pending.text:
+                        out.write(escape(pending.text))
+                else:
+                    if pending.tail:
+                        out.write(escape(pending.tail))
+                    stack[-1].remove(pending)
+                pending = None
+
+            if event == "start":
+                if XMLParser._is_stream_unit(elem, stack):
+                    unit, depth = elem, 1
+                    continue
+
+                element_declarations = namespaces.pop(elem, None)
+                scopes.append(XMLParser._open_scope(scopes[-1], element_declarations))
+                out.write(f"<{XMLParser._start_tag(elem, scopes[-1], element_declarations)}>")
+                stack.append(elem)
+                pending, pending_tail = elem, False
+
+            elif elem is unit:
+                XMLParser._fix_stream_unit(elem, crs_params, cad_region)
+                XMLParser._write_element(out.write, elem, scopes[-1], namespaces)
+                unit = None
+                pending, pending_tail = elem, True
+
+            else:
+                stack.pop()
+                if elem.tag == "cadastral_number" and stack and stack[-1].tag == "cadastral_block":
+                    cad_region = XMLParser._extract_cad_region(elem.text)
+                elif elem.tag == "cadastral_block":
+                    cad_region = None
+
+                out.write(f"</{XMLParser._qualify(elem.tag, scopes.pop())}>")
+                if stack:
+                    pending, pending_tail = elem, True
 
-        for report_file in report_files:
-            XMLParser._fix_xml_sk(report_file, crs_params)
+        out.flush()
+        out.detach()
+
+    @staticmethod
+    def _is_report(name: str) -> bool:
+        return fnmatchcase(PurePosixPath(name).name, "report*.xml")
 
     @staticmethod
     def fix_sk_id(arc_path):
         """Запуск проверки и исправления координат в XML файлах"""
-        XMLParser.extract_for_parsing(arc_path, XMLParser._start_fix_process)
+        crs_params = crs_registry.get_regions()
+        fix_func = XMLParser._fix_xml_sk_stream if XMLParser.streaming else XMLParser._fix_xml_sk
+
+        XMLParser.rewrite_archive(arc_path, XMLParser._is_report, partial(fix_func, crs_params=crs_params))
 
 
 class SHPParser(Parser):
+    """Установка CRS в результатах конвертации (SHP, GPKG, GeoJSON, MapInfo)"""
+
+    extensions = {
+        ProcessingFormat.shape_file: ".shp",
+        ProcessingFormat.gpkg: ".gpkg",
+        ProcessingFormat.geojson: ".geojson",
+        ProcessingFormat.mapinfo: ".tab",
+    }
+
+    # Чтение и запись через Arrow, если установлен pyarrow
+    use_arrow = find_spec("pyarrow") is not None
+
     @staticmethod
-    def _get_shp_crs(gdf: gpd.GeoDataFrame):
-        if "sk" in gdf.columns:
-            sk = gdf["sk"].values[0]
-            if sk != "Ошибка в координатах":
-                return sk
+    def _get_layer_sk(file_path: str, layer: str) -> str | None:
+        """Определение SK по первому объекту слоя (геометрия не читается)"""
+        if "sk" not in pyogrio.read_info(file_path, layer=layer)["fields"]:
+            return None
+
+        df = pyogrio.read_dataframe(file_path, layer=layer, columns=["sk"], read_geometry=False, max_features=1)
+        if df.empty:
+            return None
+
+        sk = df["sk"].iloc[0]
+        if isinstance(sk, str) and sk and sk != "Ошибка в координатах":
+            return sk
 
         return None
 
     @staticmethod
-    def _set_shp_crs(gdf: gpd.GeoDataFrame, crs_params, gdf_sk):
-        try:
-            gdf.crs = crs_params[gdf_sk]
-            return gdf.to_crs(epsg=4326)
-        except KeyError:
-            raise ValueError(f"SHPParser: Параметры для CRS '{gdf_sk}' не найдены")
+    def _transform(geometry: np.ndarray, transformer) -> np.ndarray:
+        """Перепроецирование массива геометрий одним вызовом pyproj для всех координат"""
+
+        def transform(coords: np.ndarray) -> np.ndarray:
+            # shapely.transform передает координаты массивом (N, 2), pyproj ожидает x и y отдельно
+            x, y = transformer.transform(coords[:, 0], coords[:, 1])
+            return np.column_stack((x, y))
+
+        return shapely.transform(geometry, transform)
+
+    @staticmethod
+    def _set_layer_crs(gdf: gpd.GeoDataFrame, sk: str):
+        transformer = crs_registry.get_transformer(sk)
+        geometry = SHPParser._transform(np.asarray(gdf.geometry.values), transformer)
+        return gdf.set_geometry(gpd.GeoSeries(geometry, index=gdf.index, crs="EPSG:4326"))
 
     @staticmethod
-    def _start_fix_process(directory_path):
-        shp_files = [str(file.resolve()) for file in Path(directory_path).rglob("*.shp")]
-        crs_params = SHPParser._load_crs_params("app/msk_params.yaml")
+    def _set_features_crs(
+        gdf: gpd.GeoDataFrame, layer: str
+    ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame | None] | None:
+        """Перепроецирование по SK каждого объекта: одно преобразование на каждую МСК слоя.
+
+        Объекты без SK (или с ошибкой в координатах) возвращаются отдельно с исходной геометрией:
+        их МСК неизвестна, и в слое с EPSG:4326 они оказались бы в неверном месте
+        """
+        sk = gdf["sk"]
+        valid = sk.notna() & (sk != "") & (sk != "Ошибка в координатах")
+        codes, zones = pd.factorize(sk.where(valid))
+
+        if not len(zones):
+            return None
+
+        print(f"Определены SK {list(zones)} для слоя '{layer}'")
+        unknown = None
+        if not valid.all():
+            unknown = gdf[~valid]
+            gdf, codes = gdf[valid], codes[valid.to_numpy()]
+
+        geometry = np.asarray(gdf.geometry.values).copy()
+        for code, zone in enumerate(zones):
+            mask = codes == code
+            transformer = crs_registry.get_transformer(zone)
+            geometry[mask] = SHPParser._transform(geometry[mask], transformer)
+
+        return gdf.set_geometry(gpd.GeoSeries(geometry, index=gdf.index, crs="EPSG:4326")), unknown
 
-        for shp_file in shp_files:
-            print(f"Обработка SHP {shp_file}")
-            gdf = gpd.read_file(shp_file)
-            gdf_sk = SHPParser._get_shp_crs(gdf)
+    @staticmethod
+    def _write_unknown_features(gdf: gpd.GeoDataFrame, file_path: str, layer: str, driver: str):
+        """Объекты без SK сохраняются рядом с обработанным слоем: в GPKG - отдельным слоем, иначе - файлом"""
+        name = f"{layer}_no_sk"
+        print(f"Слой '{layer}': {len(gdf)} объектов без SK сохранены без перепроецирования в '{name}'")
+
+        if driver == str(ProcessingFormat.gpkg):
+            pyogrio.write_dataframe(gdf, file_path, layer=name, driver=driver, use_arrow=SHPParser.use_arrow)
+        else:
+            path = Path(file_path)
+            target = str(path.with_name(f"{path.stem}_no_sk{path.suffix}"))
+            pyogrio.write_dataframe(gdf, target, driver=driver, use_arrow=SHPParser.use_arrow)
 
-            if gdf_sk:
-                print(f"Определена SK '{gdf_sk}'")
-                gdf = SHPParser._set_shp_crs(gdf, crs_params, gdf_sk)
-                gdf.to_file(shp_file)
+    @staticmethod
+    def _remove_dataset(file_path: str):
+        """Удаление файла данных вместе с сопутствующими файлами (.dbf, .shx, .map, .id и т.д.)"""
+        path = Path(file_path)
+        for file in path.parent.glob(f"{glob.escape(path.stem)}.*"):
+            if file.stem == path.stem:
+                file.unlink()
+
+    @staticmethod
+    def _fix_layer_file(file_path: str, driver: str, by_feature: bool = False):
+        print(f"Обработка файла {file_path}")
+
+        for layer in pyogrio.list_layers(file_path)[:, 0]:
+            if by_feature:
+                if "sk" not in pyogrio.read_info(file_path, layer=layer)["fields"]:
+                    continue
+
+                gdf = pyogrio.read_dataframe(file_path, layer=layer, use_arrow=SHPParser.use_arrow)
+                result = SHPParser._set_features_crs(gdf, layer)
+                if result is None:
+                    continue
+                gdf, unknown = result
+            else:
+                sk = SHPParser._get_layer_sk(file_path, layer)
+                if not sk:
+                    continue
+
+                print(f"Определена SK '{sk}' для слоя '{layer}'")
+                gdf = pyogrio.read_dataframe(file_path, layer=layer, use_arrow=SHPParser.use_arrow)
+                gdf, unknown = SHPParser._set_layer_crs(gdf, sk), None
+
+            # В многослойном GPKG заменяется только обработанный слой, однослойные форматы записываются заново
+            if driver == str(ProcessingFormat.gpkg):
+                pyogrio.write_dataframe(gdf, file_path, layer=layer, driver=driver, use_arrow=SHPParser.use_arrow)
+            else:
+                SHPParser._remove_dataset(file_path)
+                pyogrio.write_dataframe(gdf, file_path, driver=driver, use_arrow=SHPParser.use_arrow)
+
+            if unknown is not None:
+                SHPParser._write_unknown_features(unknown, file_path, layer, driver)
+
+    @staticmethod
+    def _start_fix_process(directory_path: str, data_format: ProcessingFormat, by_feature: bool = False):
+        extension = SHPParser.extensions[data_format]
+        files = [str(file.resolve()) for file in Path(directory_path).rglob("*") if file.suffix.lower() == extension]
+        SHPParser._map(SHPParser._fix_layer_file, [(file, str(data_format), by_feature) for file in files])
 
     @staticmethod
-    def fix_crs(arc_path):
-        """Запуск проверки и установки CRS в SHP файлах"""
-        SHPParser.extract_for_parsing(arc_path, SHPParser._start_fix_process)
+    def fix_crs(arc_path, data_format: str = str(ProcessingFormat.shape_file), by_feature: bool = False):
+        """Запуск проверки и установки CRS в файлах результатов
+
+        by_feature: SK определяется для каждого объекта, а не по первому объекту слоя
+        (нужно для объединенных слоев, где кварталы относятся к разным МСК)
+        """
+        data_format = ProcessingFormat(data_format)
+        extension = SHPParser.extensions[data_format]
+
+        with zipfile.ZipFile(arc_path, "r") as archive:
+            layers = {
+                stem
+                for stem, suffix in map(os.path.splitext, archive.namelist())
+                if suffix.lower() == extension
+            }
+
+        # Распаковываются только файлы с данными (со всеми сопутствующими файлами)
+        SHPParser.patch_archive(
+            arc_path,
+            lambda name: os.path.splitext(name)[0] in layers,
+            lambda directory_path: SHPParser._start_fix_process(directory_path, data_format, by_feature),
+        )
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+
+from zoneinfo import ZoneInfo
+
+from .governor import governor
+from .ng_toolbox import NGToolbox
+from .repository import Repository
+from .worker import dispatch_stage, fetch_kpt
+
+
+class StatusPoller:
+    """Общий опрос статусов всех задач в Toolbox (статус converting).
+
+    Этап ожидания конвейера: задачи Celery не занимают worker на время конвертации.
+    Готовые результаты передаются этапу fetch_kpt.
+    """
+
+    interval = float(os.getenv("POLLER_INTERVAL", "5"))  # период проверки списка задач, секунды
+    rate = float(os.getenv("POLLER_RATE", "2"))  # не более запросов статуса в секунду
+    concurrency = int(os.getenv("POLLER_CONCURRENCY", "4"))  # одновременных запросов статуса
+    max_delay = 60 * 5  # максимальная задержка между опросами одной задачи
+    max_total_time = 60 * 90  # 90 минут
+
+    def __init__(self):
+        self._schedule = {}  # id задачи -> (время следующего опроса, число попыток)
+        self._semaphore = asyncio.Semaphore(StatusPoller.concurrency)
+        self._rate_lock = asyncio.Lock()
+        self._next_request = 0.0
+
+    async def _wait_rate(self):
+        """Равномерное распределение запросов: не чаще rate в секунду на все задачи"""
+        async with self._rate_lock:
+            now = time.monotonic()
+            if self._next_request > now:
+                await asyncio.sleep(self._next_request - now)
+            self._next_request = max(now, self._next_request) + 1 / StatusPoller.rate
+
+    def _backoff(self, task_id: int):
+        _, attempts = self._schedule[task_id]
+        sleep_time = min(attempts * 2 + random.uniform(0, 10), StatusPoller.max_delay)
+        self._schedule[task_id] = (time.monotonic() + sleep_time, attempts + 1)
+
+    @staticmethod
+    def _converting_time(task) -> float:
+        # updated_at не меняется, пока задача ожидает конвертации
+        updated_at = task.updated_at
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=ZoneInfo("UTC"))
+        return (datetime.now(ZoneInfo("UTC")) - updated_at).total_seconds()
+
+    async def _poll_task(self, task):
+        async with self._semaphore:
+            await self._wait_rate()
+
+            try:
+                print(f"Получение статуса задачи {task.task_id}")
+                status = await NGToolbox.status(task_id=task.task_id)
+            except Exception as e:
+                print(f"StatusPoller: Ошибка получения статуса задачи {task.task_id}: {e}")
+                self._backoff(task.id)
+                return
+
+            if status["state"] == "FAILED":
+                await self._finish(task, status="failed", error=status["error"] or "Неизвестная ошибка")
+            elif status["state"] == "CANCELLED":
+                await self._finish(task, status="failed", error="Задача была отменена")
+            elif status["state"] == "SUCCESS":
+                output = status.get("output") or [{}]
+                if not output[0].get("value"):
+                    await self._finish(task, status="failed", error="Toolbox не вернул ссылку на результат конвертации")
+                    return
+
+                self._schedule.pop(task.id, None)
+                await governor.release(task.id)
+                await dispatch_stage(fetch_kpt, task.id, output[0]["value"])
+            elif self._converting_time(task) > StatusPoller.max_total_time:
+                await self._finish(task, status="failed", error="Превышено время обработки задачи")
+            else:
+                self._backoff(task.id)
+
+    async def _finish(self, task, **kwargs):
+        self._schedule.pop(task.id, None)
+        await governor.release(task.id)
+        await Repository.update_task(task.id, None, **kwargs)
+
+    async def _tick(self):
+        tasks = await Repository.get_converting_tasks()
+        now = time.monotonic()
+
+        # Задачи, удаленные или перезапущенные вне опроса, исключаются из расписания
+        active = {task.id for task in tasks}
+        for task_id in set(self._schedule) - active:
+            del self._schedule[task_id]
+
+        due = []
+        for task in tasks:
+            if task.id not in self._schedule:
+                # Случайный сдвиг, чтобы одновременно добавленные задачи не опрашивались пачкой
+                self._schedule[task.id] = (now + random.uniform(0, 3), 0)
+            if self._schedule[task.id][0] <= now:
+                due.append(task)
+
+        await asyncio.gather(*[self._poll_task(task) for task in due])
+
+    async def run(self):
+        print("StatusPoller: Запуск опроса статусов задач")
+        while True:
+            try:
+                await self._tick()
+            except Exception as e:
+                print(f"StatusPoller: Ошибка цикла опроса: {e}")
+
+            await asyncio.sleep(StatusPoller.interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(StatusPoller().run())
@@ -0,0 +1,19 @@
+import asyncio
+import os
+import weakref
+
+import redis.asyncio as aioredis
+
+redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> redis.asyncio.Redis
+
+
+def get_redis() -> aioredis.Redis:
+    """Общий клиент Redis для текущего event loop (соединения redis.asyncio привязаны к loop)"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(redis_url)
+        _clients[loop] = client
+    return client
@@ -1,21 +1,64 @@
-from collections import defaultdict
+from collections import Counter
 from contextlib import asynccontextmanager
+from datetime import datetime
 from uuid import uuid4
 
-from sqlalchemy.sql import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.sql import delete, func, insert, select
 
-from app.db import GroupTable, TaskTable, new_session
+from app.db import GroupStatisticsTable, GroupTable, TaskTable, new_session
+
+from .events import EventBus, event_bus
 
 
 @asynccontextmanager
 async def transaction(session: None = None):
     if session is None:
-        async with new_session() as new_sess:
-            yield new_sess
+        new_sess = new_session()
+        try:
+            async with new_sess:
+                yield new_sess
+        finally:
+            # События публикуются после возврата соединения в пул, в том числе при ошибке после commit
+            await event_bus.publish_committed(new_sess)
     else:
         yield session
 
 
+def new_statistics() -> dict:
+    return {
+        "loaded": 0,
+        "completed": 0,
+        "failed": 0,
+        "in_progress": 0,
+        "remaining": 0,
+    }
+
+
+def add_statistics(statistics: dict, status: str | None, count: int):
+    """Учет count задач со статусом status в сводной статистике"""
+    if status is None or not count:
+        return
+
+    if status == "failed":
+        statistics["failed"] += count
+    elif status == "completed":
+        statistics["completed"] += count
+    elif status not in ("accepted", "queued"):
+        statistics["in_progress"] += count
+
+    statistics["loaded"] += count
+    statistics["remaining"] = statistics["loaded"] - statistics["completed"] - statistics["failed"]
+
+
+def chunks(values, size: int = 500):
+    """Разбиение значений для IN (...) с учетом ограничения числа параметров запроса"""
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
 class Repository:
     @staticmethod
     async def get_task(task_id: int, base_session=None):
@@ -31,6 +74,66 @@ class Repository:
             tasks = await session.execute(statement)
             return tasks.scalars().all()
 
+    @staticmethod
+    async def get_tasks_page(
+        fields: list[str],
+        limit: int,
+        after: int | None = None,
+        group_id: int | None = None,
+        statuses: list[str] | None = None,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        base_session=None,
+    ):
+        """Страница задач по курсору (id последней задачи предыдущей страницы)"""
+        async with transaction(base_session) as session:
+            columns = [getattr(TaskTable, field) for field in fields]
+            statement = select(*columns).order_by(TaskTable.id).limit(limit)
+
+            if after is not None:
+                statement = statement.where(TaskTable.id > after)
+            if group_id is not None:
+                statement = statement.where(TaskTable.group_id == group_id)
+            if statuses:
+                statement = statement.where(TaskTable.status.in_(statuses))
+            if created_from is not None:
+                statement = statement.where(TaskTable.created_at >= created_from)
+            if created_to is not None:
+                statement = statement.where(TaskTable.created_at < created_to)
+
+            result = await session.execute(statement)
+            return [dict(row) for row in result.mappings()]
+
+    @staticmethod
+    async def get_duplicates(files: list[tuple[str, str]], base_session=None) -> set[tuple[str, str]]:
+        """Пары (имя, хэш) из files, для которых уже есть задачи"""
+        duplicates = set()
+
+        async with transaction(base_session) as session:
+            for files_chunk in chunks(set(files)):
+                statement = select(TaskTable.name, TaskTable.source_hash).where(
+                    TaskTable.name.in_({name for name, _ in files_chunk}),
+                    TaskTable.source_hash.in_({source_hash for _, source_hash in files_chunk}),
+                )
+                duplicates.update((row.name, row.source_hash) for row in await session.execute(statement))
+
+        return duplicates & set(files)
+
+    @staticmethod
+    async def get_completed_by_hash(hashes: list[str], base_session=None):
+        """Завершенные задачи с результатами для указанных хэшей исходных файлов"""
+        tasks = []
+        async with transaction(base_session) as session:
+            for hashes_chunk in chunks(set(hashes)):
+                statement = select(TaskTable).where(
+                    TaskTable.source_hash.in_(hashes_chunk),
+                    TaskTable.status == "completed",
+                    TaskTable.kpt_file.isnot(None),
+                )
+                tasks.extend((await session.execute(statement)).scalars().all())
+
+        return tasks
+
     @staticmethod
     async def get_group(group_id: int, base_session=None):
         async with transaction(base_session) as session:
@@ -38,10 +141,12 @@ class Repository:
                 select(
                     GroupTable.id,
                     GroupTable.name,
+                    GroupTable.priority,
                     GroupTable.created_at,
-                    TaskTable.status,
+                    GroupStatisticsTable.status,
+                    GroupStatisticsTable.count,
                 )
-                .join(TaskTable, TaskTable.group_id == GroupTable.id)
+                .outerjoin(GroupStatisticsTable, GroupStatisticsTable.group_id == GroupTable.id)
                 .where(GroupTable.id == group_id)
             )
             result = await session.execute(statement)
@@ -49,134 +154,132 @@ class Repository:
             group = {
                 "id": group_id,
                 "name": None,
+                "priority": None,
                 "created_at": None,
-                "statistics": {
-                    "loaded": 0,
-                    "completed": 0,
-                    "failed": 0,
-                    "in_progress": 0,
-                    "remaining": 0,
-                },
+                "statistics": new_statistics(),
             }
 
-            async for row in result:
-                if not group["name"]:
-                    group["name"] = row.name
-                    group["created_at"] = row.created_at
-
-                status = row.status if row.status else "accepted"
-                if status == "failed":
-                    group["statistics"]["failed"] += 1
-                elif status == "completed":
-                    group["statistics"]["completed"] += 1
-                elif status != "accepted":
-                    group["statistics"]["in_progress"] += 1
-
-                group["statistics"]["loaded"] += 1
-
-            group["statistics"]["remaining"] = (
-                group["statistics"]["loaded"] - group["statistics"]["completed"] - group["statistics"]["failed"]
-            )
+            for row in result:
+                group["name"] = row.name
+                group["priority"] = row.priority
+                group["created_at"] = row.created_at
+                add_statistics(group["statistics"], row.status, row.count)
 
             return group
 
     @staticmethod
-    async def get_groups(base_session=None):
+    async def get_groups(limit: int | None = None, after: int | None = None, base_session=None):
         async with transaction(base_session) as session:
-            statement = select(
-                GroupTable.id,
-                GroupTable.name,
-                GroupTable.created_at,
-                TaskTable.status,
-            ).join(TaskTable, TaskTable.group_id == GroupTable.id)
+            groups_page = select(GroupTable.id).order_by(GroupTable.id).limit(limit)
+            if after is not None:
+                groups_page = groups_page.where(GroupTable.id > after)
+            groups_page = groups_page.subquery()
 
-            result = await session.execute(statement)
-
-            groups = defaultdict(
-                lambda: {
-                    "id": None,
-                    "name": None,
-                    "created_at": None,
-                    "statistics": {
-                        "loaded": 0,
-                        "completed": 0,
-                        "failed": 0,
-                        "in_progress": 0,
-                        "remaining": 0,
-                    },
-                }
+            statement = (
+                select(
+                    GroupTable.id,
+                    GroupTable.name,
+                    GroupTable.priority,
+                    GroupTable.created_at,
+                    GroupStatisticsTable.status,
+                    GroupStatisticsTable.count,
+                )
+                .join(groups_page, groups_page.c.id == GroupTable.id)
+                .outerjoin(GroupStatisticsTable, GroupStatisticsTable.group_id == GroupTable.id)
+                .order_by(GroupTable.id)
             )
 
+            result = await session.execute(statement)
+
+            groups = {}
             for row in result:
-                group_id = row.id
-                group = groups[group_id]
-
-                if not group["id"]:
-                    group["id"] = row.id
-                    group["name"] = row.name
-                    group["created_at"] = row.created_at
-
-                status = row.status if row.status else "accepted"
-                if status == "failed":
-                    group["statistics"]["failed"] += 1
-                elif status == "completed":
-                    group["statistics"]["completed"] += 1
-                elif status != "accepted":
-                    group["statistics"]["in_progress"] += 1
-
-                group["statistics"]["loaded"] += 1
-
-            for group in groups.values():
-                group["statistics"]["remaining"] = (
-                    group["statistics"]["loaded"] - group["statistics"]["completed"] - group["statistics"]["failed"]
+                group = groups.setdefault(
+                    row.id,
+                    {
+                        "id": row.id,
+                        "name": row.name,
+                        "priority": row.priority,
+                        "created_at": row.created_at,
+                        "statistics": new_statistics(),
+                    },
                 )
+                add_statistics(group["statistics"], row.status, row.count)
 
+            # Группы без задач тоже возвращаются, чтобы курсор страницы не терял позицию
             return list(groups.values())
 
     @staticmethod
     async def get_statistics(base_session=None):
         async with transaction(base_session) as session:
-            statement = select(TaskTable.status)
+            statement = select(
+                GroupStatisticsTable.status,
+                func.sum(GroupStatisticsTable.count).label("count"),
+            ).group_by(GroupStatisticsTable.status)
             result = await session.execute(statement)
 
-            statistics = {
-                "loaded": 0,
-                "completed": 0,
-                "failed": 0,
-                "in_progress": 0,
-                "remaining": 0,
-            }
-
+            statistics = new_statistics()
             for row in result:
-                status = row.status if row.status else "accepted"
-                if status == "failed":
-                    statistics["failed"] += 1
-                elif status == "completed":
-                    statistics["completed"] += 1
-                elif status != "accepted":
-                    statistics["in_progress"] += 1
+                add_statistics(statistics, row.status, row.count)
+
+            return statistics
 
-                statistics["loaded"] += 1
+    @staticmethod
+    async def change_statistics(session, group_id: int, status: str | None, delta: int):
+        """Изменение счетчика группы в той же транзакции, что и изменение задачи"""
+        dialect_insert = postgresql_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+        statement = (
+            dialect_insert(GroupStatisticsTable)
+            .values(group_id=group_id, status=status or "accepted", count=delta)
+            .on_conflict_do_update(
+                index_elements=["group_id", "status"],
+                set_={"count": GroupStatisticsTable.count + delta},
+            )
+        )
+        await session.execute(statement)
 
-            statistics["remaining"] = statistics["loaded"] - statistics["completed"] - statistics["failed"]
+    @staticmethod
+    async def apply_statistics(session, changes: Counter):
+        """Изменение счетчиков пачки задач: changes[(group_id, status)] = delta"""
+        for (group_id, status), delta in changes.items():
+            if delta:
+                await Repository.change_statistics(session, group_id, status, delta)
 
-            return statistics
+    @staticmethod
+    async def rebuild_statistics(base_session=None):
+        """Пересчет счетчиков по таблице задач (GROUP BY по индексу group_id, status)"""
+        async with transaction(base_session) as session:
+            status = func.coalesce(TaskTable.status, "accepted")
+            counts = select(TaskTable.group_id, status, func.count()).group_by(TaskTable.group_id, status)
+
+            await session.execute(delete(GroupStatisticsTable))
+            await session.execute(
+                insert(GroupStatisticsTable).from_select(["group_id", "status", "count"], counts)
+            )
+
+            if base_session is None:
+                await session.commit()
 
     @staticmethod
     async def update_task(identifier: int, base_session=None, **kwargs):
         async with transaction(base_session) as session:
             task = await session.get(TaskTable, identifier)
+            status = task.status
             for key, value in kwargs.items():
                 setattr(task, key, value)
 
+            if task.status != status:
+                await Repository.change_statistics(session, task.group_id, status, -1)
+                await Repository.change_statistics(session, task.group_id, task.status, 1)
+                EventBus.add_task_event(session, task, status, task.status)
+
             if base_session is None:
                 await session.commit()
             return task
 
     @staticmethod
-    async def create_group(name: str, base_session=None):
+    async def create_group(name: str, base_session=None, priority: int = 1):
         async with transaction(base_session) as session:
-            group = GroupTable(name=name)
+            group = GroupTable(name=name, priority=priority)
             session.add(group)
 
             if base_session is None:
@@ -187,20 +290,68 @@ class Repository:
     async def create_task(base_session=None, **kwargs):
         async with transaction(base_session) as session:
             task = TaskTable(**kwargs)
-            task.status = "accepted"
+            if task.status is None:
+                task.status = "accepted"
             task.celery_id = str(uuid4())
             session.add(task)
+            await Repository.change_statistics(session, task.group_id, task.status, 1)
+            EventBus.add_task_event(session, task, None, task.status)
 
             if base_session is None:
                 await session.commit()
             return task
 
+    @staticmethod
+    async def create_tasks(rows: list[dict], base_session=None):
+        """Создание пачки задач одним INSERT ... RETURNING"""
+        async with transaction(base_session) as session:
+            rows = [{**row, "status": row.get("status") or "accepted", "celery_id": str(uuid4())} for row in rows]
+            result = await session.scalars(insert(TaskTable).returning(TaskTable, sort_by_parameter_order=True), rows)
+            tasks = result.all()
+
+            changes = Counter()
+            for task in tasks:
+                changes[(task.group_id, task.status)] += 1
+                EventBus.add_task_event(session, task, None, task.status)
+            await Repository.apply_statistics(session, changes)
+
+            if base_session is None:
+                await session.commit()
+            return tasks
+
+    @staticmethod
+    async def update_tasks(tasks, base_session=None, **kwargs):
+        """Одинаковое изменение пачки задач с новыми celery_id.
+
+        Изменения одинаковых полей SQLAlchemy отправляет одним executemany UPDATE.
+        """
+        async with transaction(base_session) as session:
+            changes = Counter()
+            for task in tasks:
+                status = kwargs.get("status", task.status)
+                if task.status != status:
+                    changes[(task.group_id, task.status)] -= 1
+                    changes[(task.group_id, status)] += 1
+                    EventBus.add_task_event(session, task, task.status, status)
+
+                task.celery_id = str(uuid4())
+                for key, value in kwargs.items():
+                    setattr(task, key, value)
+
+            await Repository.apply_statistics(session, changes)
+
+            if base_session is None:
+                await session.commit()
+            return tasks
+
     @staticmethod
     async def delete_task(task_id: int, base_session=None):
         async with transaction(base_session) as session:
             task = await session.get(TaskTable, task_id)
             if task:
                 await session.delete(task)
+                await Repository.change_statistics(session, task.group_id, task.status, -1)
+                EventBus.add_task_event(session, task, task.status, None)
 
                 if base_session is None:
                     await session.commit()
@@ -208,15 +359,40 @@ class Repository:
 
     @staticmethod
     async def delete_group(group_id: int, base_session=None):
+        """Удаление группы вместе с задачами; возвращает группу и удаленные задачи"""
         async with transaction(base_session) as session:
             group = await session.get(GroupTable, group_id)
+            tasks = []
             if group:
+                statement = (
+                    delete(TaskTable)
+                    .where(TaskTable.group_id == group_id)
+                    .returning(
+                        TaskTable.id,
+                        TaskTable.group_id,
+                        TaskTable.name,
+                        TaskTable.status,
+                        TaskTable.error,
+                        TaskTable.created_at,
+                        TaskTable.celery_id,
+                        TaskTable.source_file,
+                        TaskTable.kpt_file,
+                    )
+                )
+                tasks = (await session.execute(statement)).all()
+                for task in tasks:
+                    EventBus.add_task_event(session, task, task.status, None)
+
+                await session.execute(
+                    delete(GroupStatisticsTable).where(GroupStatisticsTable.group_id == group_id)
+                )
                 await session.delete(group)
+                EventBus.add_group_event(session, group_id)
 
                 if base_session is None:
                     await session.commit()
 
-            return group
+            return group, tasks
 
     @staticmethod
     async def get_working_tasks(base_session=None):
@@ -228,3 +404,69 @@ class Repository:
             )
 
             return await session.execute(statement)
+
+    @staticmethod
+    async def set_group_priority(group_id: int, priority: int, base_session=None):
+        async with transaction(base_session) as session:
+            group = await session.get(GroupTable, group_id)
+            if group:
+                group.priority = priority
+
+                if base_session is None:
+                    await session.commit()
+            return group
+
+    @staticmethod
+    async def get_scheduled_groups(base_session=None) -> dict[int, int]:
+        """Группы с задачами, ожидающими отправки в очередь: id группы -> приоритет (по счетчикам статусов)"""
+        async with transaction(base_session) as session:
+            statement = (
+                select(GroupTable.id, func.coalesce(GroupTable.priority, 1))
+                .join(GroupStatisticsTable, GroupStatisticsTable.group_id == GroupTable.id)
+                .where(GroupStatisticsTable.status == "accepted", GroupStatisticsTable.count > 0)
+            )
+            return {group_id: priority for group_id, priority in await session.execute(statement)}
+
+    @staticmethod
+    async def get_scheduled_tasks(group_ids: list[int], limit: int, base_session=None):
+        """Первые limit ожидающих задач каждой группы в порядке добавления"""
+        async with transaction(base_session) as session:
+            position = (
+                func.row_number().over(partition_by=TaskTable.group_id, order_by=TaskTable.id).label("position")
+            )
+            ranked = (
+                select(TaskTable.id, position)
+                .where(TaskTable.status == "accepted", TaskTable.group_id.in_(group_ids))
+                .subquery()
+            )
+            statement = (
+                select(TaskTable)
+                .join(ranked, ranked.c.id == TaskTable.id)
+                .where(ranked.c.position <= limit)
+                .order_by(TaskTable.id)
+            )
+            tasks = await session.execute(statement)
+            return tasks.scalars().all()
+
+    @staticmethod
+    async def count_tasks(
+        statuses: str | list[str] | None = None, group_id: int | None = None, base_session=None
+    ) -> int:
+        """Число задач в статусах (всех, если не указаны) по счетчикам групп"""
+        if isinstance(statuses, str):
+            statuses = [statuses]
+
+        async with transaction(base_session) as session:
+            statement = select(func.coalesce(func.sum(GroupStatisticsTable.count), 0))
+            if statuses:
+                statement = statement.where(GroupStatisticsTable.status.in_(statuses))
+            if group_id is not None:
+                statement = statement.where(GroupStatisticsTable.group_id == group_id)
+            return (await session.execute(statement)).scalar_one()
+
+    @staticmethod
+    async def get_converting_tasks(base_session=None):
+        async with transaction(base_session) as session:
+            statement = select(TaskTable).where(TaskTable.status == "converting", TaskTable.task_id.isnot(None))
+            tasks = await session.execute(statement)
+            return tasks.scalars().all()
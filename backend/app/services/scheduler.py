@@ -0,0 +1,81 @@
+import asyncio
+import os
+from collections import deque
+
+from .repository import Repository, transaction
+from .worker import celery, prepare_kpt
+
+
+class TaskScheduler:
+    """Отправка принятых задач в очередь Celery с распределением между группами.
+
+    До отправки в Toolbox (очередь, подготовка XML, ожидание слота и загрузка) находится не более
+    watermark задач, остальные ждут в БД (статус accepted). Места делятся между группами взвешенным
+    round-robin по приоритету группы, поэтому небольшая группа не ждет окончания большой, загруженной раньше:
+    слоты RemoteGovernor достаются только уже выбранным планировщиком задачам.
+    """
+
+    interval = float(os.getenv("SCHEDULER_INTERVAL", "2"))  # период проверки очереди, секунды
+    watermark = int(os.getenv("SCHEDULER_WATERMARK", "4"))  # не более задач до отправки в Toolbox
+    pending_statuses = ["queued", "parsing", "uploading"]
+
+    def __init__(self):
+        self._weights = {}  # id группы -> текущий вес (плавный взвешенный round-robin)
+
+    def _pick(self, priorities: dict[int, int], pending: dict[int, deque], count: int) -> list:
+        """Выбор count задач: каждый раз группа с наибольшим накопленным весом"""
+        for group_id in set(self._weights) - set(priorities):
+            del self._weights[group_id]
+
+        selected = []
+        while len(selected) < count and pending:
+            total = 0
+            for group_id in pending:
+                self._weights[group_id] = self._weights.get(group_id, 0) + priorities[group_id]
+                total += priorities[group_id]
+
+            group_id = max(pending, key=lambda group_id: self._weights[group_id])
+            self._weights[group_id] -= total
+            selected.append(pending[group_id].popleft())
+
+            if not pending[group_id]:
+                del pending[group_id]
+
+        return selected
+
+    async def _tick(self):
+        free = TaskScheduler.watermark - await Repository.count_tasks(TaskScheduler.pending_statuses)
+        if free <= 0:
+            return
+
+        priorities = await Repository.get_scheduled_groups()
+        if not priorities:
+            return
+
+        async with transaction() as session:
+            pending = {}
+            for task in await Repository.get_scheduled_tasks(list(priorities), free, session):
+                pending.setdefault(task.group_id, deque()).append(task)
+
+            tasks = self._pick(priorities, pending, free)
+            await Repository.update_tasks(tasks, session, status="queued")
+            await session.commit()
+
+        # Статус queued фиксируется до отправки, чтобы при следующей проверке задачи уже учитывались
+        with celery.producer_or_acquire() as producer:
+            for task in tasks:
+                prepare_kpt.apply_async(args=(task.id,), task_id=task.celery_id, producer=producer)
+
+    async def run(self):
+        print("TaskScheduler: Запуск распределения задач по очереди")
+        while True:
+            try:
+                await self._tick()
+            except Exception as e:
+                print(f"TaskScheduler: Ошибка цикла распределения: {e}")
+
+            await asyncio.sleep(TaskScheduler.interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(TaskScheduler().run())
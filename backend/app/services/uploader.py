@@ -1,5 +1,7 @@
 import asyncio
+import hashlib
 import os
+import shutil
 import zipfile
 from pathlib import Path
 from uuid import uuid4
@@ -17,20 +19,25 @@ class Uploader:
         return Path(path).stem
 
     @staticmethod
-    async def find_path(folder: str, filename: str):
-        if not await aos.path.exists(folder):
-            await aos.makedirs(folder)
-
-        base_name, extension = os.path.splitext(filename)
-        counter = 1
-        full_path = os.path.join(folder, filename)
-
-        while await aos.path.exists(full_path):
-            new_filename = f"{base_name}({counter}){extension}"
-            full_path = os.path.join(folder, new_filename)
-            counter += 1
-
-        return full_path
+    async def reserve_path(folder: str, filename: str):
+        """Свободное имя файла в folder. Имя сразу занимается пустым файлом (O_EXCL),
+        поэтому одновременные задачи с одинаковым именем получают разные пути"""
+        await aos.makedirs(folder, exist_ok=True)
+
+        def reserve():
+            base_name, extension = os.path.splitext(filename)
+            counter = 1
+            full_path = os.path.join(folder, filename)
+
+            while True:
+                try:
+                    os.close(os.open(full_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    return full_path
+                except FileExistsError:
+                    full_path = os.path.join(folder, f"{base_name}({counter}){extension}")
+                    counter += 1
+
+        return await asyncio.to_thread(reserve)
 
     @staticmethod
     async def upload(file: UploadFile):
@@ -39,23 +46,37 @@ class Uploader:
         if file.filename and file.filename.lower().endswith(archive_ext):
             print(f"Загрузка файла {file.filename}")
 
-            full_path = await Uploader.find_path("data/uploaded", file.filename)
+            full_path = await Uploader.reserve_path("data/uploaded", file.filename)
+            file_hash = hashlib.sha256()
 
             async with aiofiles.open(full_path, "wb") as f:
                 while content := await file.read(1024 * 1024):
+                    file_hash.update(content)
                     await f.write(content)
 
-            return full_path, Uploader.get_filename(file.filename)
+            return full_path, Uploader.get_filename(file.filename), file_hash.hexdigest()
 
     @staticmethod
-    async def save(file: bytes, filename: str, folder: str):
-        print(f"Сохранение файла {filename}")
-
-        full_path = await Uploader.find_path(folder, filename + ".zip")
-
-        async with aiofiles.open(full_path, "wb") as f:
-            await f.write(file)
-
+    async def copy_result(source: str, filename: str):
+        """Копия готового результата для новой задачи (жесткая ссылка, если возможно)"""
+        if not source or not await aos.path.exists(source):
+            return None
+
+        def link_or_copy(source, target):
+            # Ссылка создается под временным именем и заменяет зарезервированный пустой файл
+            part_path = target + ".part"
+            try:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                os.link(source, part_path)
+                os.replace(part_path, target)
+            except OSError:
+                shutil.copyfile(source, target)
+
+        full_path = await Uploader.reserve_path("data/results/", filename + ".zip")
+        await asyncio.to_thread(link_or_copy, source, full_path)
+
+        print(f"Использован готовый результат {source} для {filename}")
         return full_path
 
     @staticmethod
@@ -69,17 +90,36 @@ class Uploader:
             print(f"Удален файл {file}")
 
     @staticmethod
-    async def zip_files(paths: list[str], place="data/tmp", filename=None):
-        def write_zip(paths):
-            with zipfile.ZipFile(zip_path, "w") as zip_f:
-                for path in paths:
-                    zip_f.write(path, os.path.basename(path))
+    def stream_zip(paths: list[str], chunk_size=1024 * 1024):
+        """Архив из файлов без сжатия (результаты уже в zip), отдается по частям по мере формирования"""
+        stream = ZipStream()
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+            for path in paths:
+                info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+                with open(path, "rb") as source, archive.open(info, "w") as target:
+                    while chunk := source.read(chunk_size):
+                        target.write(chunk)
+                        yield stream.pop()
+
+                yield stream.pop()
+
+        yield stream.pop()
+
+
+class ZipStream:
+    """Поток записи ZipFile без seek: zipfile пишет размеры и CRC после данных файла"""
 
-        if filename is None:
-            filename = f"{str(uuid4())}.zip"
+    def __init__(self):
+        self._chunks = []
 
-        zip_path = await Uploader.find_path(place, filename)
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
 
-        await asyncio.to_thread(write_zip, paths)
+    def flush(self):
+        pass
 
-        return zip_path
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
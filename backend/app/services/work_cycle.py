@@ -1,27 +1,75 @@
 import asyncio
 
-import redis
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
 
 
 class PauseManager:
-    """Устанавливает глобальную паузу для обработки всех задач"""
+    """Устанавливает глобальную паузу для обработки всех задач.
+
+    Состояние хранится в Redis и переживает перезапуск процессов, об изменении сообщается через pub/sub,
+    поэтому ожидающие задачи продолжаются сразу после снятия паузы.
+    """
+
+    key = "pause"
+    channel = "pause"
+    wait_timeout = 60  # повторная проверка состояния на случай потерянного сообщения, секунды
+    reconnect_delay = 5
 
     def __init__(self):
-        self._redis_client = redis.StrictRedis(host="localhost", port=6379, db=0)
-        self._redis_client.set("pause", "false")
+        self._paused = None  # локальная копия состояния, пока работает watch
+
+    async def _read(self) -> bool:
+        return await get_redis().get(PauseManager.key) == b"true"
+
+    async def _write(self, paused: bool):
+        value = "true" if paused else "false"
+        client = get_redis()
+        await client.set(PauseManager.key, value)
+        await client.publish(PauseManager.channel, value)
+        if self._paused is not None:
+            self._paused = paused
 
     async def wait_if_paused(self):
-        while self.is_paused():
-            await asyncio.sleep(5)
+        if not await self.is_paused():
+            return
+
+        async with get_redis().pubsub() as pubsub:
+            await pubsub.subscribe(PauseManager.channel)
+            # Состояние перечитывается после подписки, чтобы не пропустить снятие паузы между запросами
+            while await self._read():
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=PauseManager.wait_timeout)
+
+    async def watch(self):
+        """Поддержание локальной копии состояния (процесс API отвечает на запросы без обращения к Redis)"""
+        while True:
+            try:
+                async with get_redis().pubsub() as pubsub:
+                    await pubsub.subscribe(PauseManager.channel)
+                    self._paused = await self._read()
+
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._paused = message["data"] == b"true"
+            except RedisError as e:
+                print(f"PauseManager: Потеряно соединение с Redis: {e}")
+                self._paused = None
+                await asyncio.sleep(PauseManager.reconnect_delay)
+            except asyncio.CancelledError:
+                self._paused = None
+                raise
 
-    def set_pause(self):
-        self._redis_client.set("pause", "true")
+    async def set_pause(self):
+        await self._write(True)
 
-    def unset_pause(self):
-        self._redis_client.set("pause", "false")
+    async def unset_pause(self):
+        await self._write(False)
 
-    def is_paused(self):
-        return self._redis_client.get("pause") == b"true"
+    async def is_paused(self) -> bool:
+        if self._paused is not None:
+            return self._paused
+        return await self._read()
 
 
 pause_manager = PauseManager()
@@ -1,13 +1,18 @@
-import asyncio
 import os
-import random
-import time
+from uuid import uuid4
 
 import urllib3
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready
+from celery.worker.control import control_command
+from sqlalchemy import text
 
+from app.db import close_connections, engine, new_session
+
+from .background_loop import BackgroundLoop
+from .governor import governor
 from .ng_toolbox import NGToolbox
-from .parsers import SHPParser, XMLParser
+from .parsers import Parser, SHPParser, XMLParser
 from .repository import Repository
 from .uploader import Uploader
 from .work_cycle import pause_manager
@@ -19,66 +24,182 @@ celery.conf.broker_url = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/
 celery.conf.result_backend = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
 
-async def check_status(task):
-    max_total_time = 60 * 90  # 90 минут
-    start_time = time.time()
-    max_delay = 60 * 5  # максимальная задержка между попытками
-    attempts = 0
+async def warm_up():
+    """Соединение с БД и клиент Toolbox создаются до первой задачи"""
+    async with new_session() as session:
+        await session.execute(text("SELECT 1"))
+    NGToolbox._get_client()
 
-    jitter = random.uniform(0, 3)
-    await asyncio.sleep(jitter)
 
-    while True:
-        if time.time() - start_time > max_total_time:
-            raise TimeoutError("Превышено время обработки задачи")
+async def close_loop_resources():
+    await NGToolbox.aclose()
+    await close_connections()
 
-        print(f"Получение статуса задачи {task.task_id}")
-        status = NGToolbox.status(task_id=task.task_id)
 
-        if status["state"] == "FAILED":
-            raise Exception(status["error"] if status["error"] else "Неизвестная ошибка")
+@worker_process_init.connect
+def start_event_loop(**kwargs):
+    # Соединения, открытые до fork, остаются родительскому процессу
+    engine.sync_engine.dispose(close=False)
+    BackgroundLoop.run(warm_up())
 
-        if status["state"] == "CANCELLED":
-            raise Exception("Задача была отменена")
 
-        if status["state"] == "SUCCESS":
-            file_url = status["output"][0]["value"]
-            file = NGToolbox.download(file_url)
-            file_path = await Uploader.save(file, task.name, "data/results/")
-            task = await Repository.update_task(task.id, None, kpt_file=file_path)
-            return task
+@worker_process_shutdown.connect
+def close_process_resources(**kwargs):
+    Parser.close_pool()
+    BackgroundLoop.stop(close_loop_resources())
 
-        jitter = random.uniform(0, 10)
-        sleep_time = min(attempts * 2 + jitter, max_delay)
-        print(f"Попытка {attempts + 1} через {sleep_time} секунд")
-        await asyncio.sleep(sleep_time)
-        attempts += 1
 
+# Этапы обработки: CPU-задачи и сетевые задачи выполняются разными worker
+celery.conf.task_routes = {
+    "app.services.worker.prepare_kpt": {"queue": "cpu"},
+    "app.services.worker.submit_kpt": {"queue": "io"},
+    "app.services.worker.fetch_kpt": {"queue": "io"},
+    "app.services.worker.postprocess_kpt": {"queue": "cpu"},
+}
+# Этапы длительные: worker не забирает из брокера больше задач, чем может выполнять
+celery.conf.worker_prefetch_multiplier = 1
 
-@celery.task()
-def collect_kpt(id: int):
-    try:
+# Очереди, получение задач из которых остановлено паузой (в главном процессе worker)
+paused_queues = []
+
+
+def stop_consuming(consumer):
+    """Задачи остаются в брокере и не занимают процессы и память worker"""
+    for queue in list(consumer.task_consumer.queues):
+        paused_queues.append(queue.name)
+        consumer.cancel_task_queue(queue.name)
+
+
+def start_consuming(consumer):
+    while paused_queues:
+        consumer.add_task_queue(paused_queues.pop(0))
+
+
+@control_command()
+def pause_consumers(state, **kwargs):
+    """Пауза: worker перестает получать задачи из своих очередей"""
+    state.consumer.call_soon(stop_consuming, state.consumer)
+    return {"ok": "consuming paused"}
+
+
+@control_command()
+def resume_consumers(state, **kwargs):
+    state.consumer.call_soon(start_consuming, state.consumer)
+    return {"ok": "consuming resumed"}
 
-        async def collect_kpt_async(id):
+
+@worker_ready.connect
+def apply_pause(sender, **kwargs):
+    # Worker, запущенный во время паузы, не начинает получать задачи.
+    # Клиент Redis привязан к loop, поэтому проверка выполняется в постоянном loop процесса
+    if BackgroundLoop.run(pause_manager.is_paused()):
+        stop_consuming(sender)
+
+
+def run_stage(id: int, stage_func, *args):
+    """Выполнение этапа в постоянном event loop процесса; ошибка любого этапа переводит задачу в failed"""
+
+    async def stage_async():
+        try:
+            # Задачи, полученные до остановки очередей, ожидают снятия паузы
             await pause_manager.wait_if_paused()
-            task = await Repository.get_task(id)
+            await stage_func(id, *args)
+        except Exception as e:
+            await Repository.update_task(id, None, status="failed", error=str(e))
+            raise e
+
+    BackgroundLoop.run(stage_async())
+
+
+async def dispatch_stage(stage, id: int, *args):
+    """Запуск следующего этапа: статус задачи фиксирует этап для возобновления после перезапуска"""
+    celery_id = str(uuid4())
+    await Repository.update_task(id, None, celery_id=celery_id, status=STAGE_STATUSES[stage.name])
+    stage.apply_async(args=(id, *args), task_id=celery_id)
+
+
+@celery.task()
+def prepare_kpt(id: int):
+    """Исправление координат в исходных XML"""
 
-            if not task.task_id:
-                await Repository.update_task(task.id, None, status="parsing")
-                XMLParser.fix_sk_id(task.source_file)
-                file_id = NGToolbox.upload(task.source_file)
-                task_id = NGToolbox.collect_kpt(file_id, identifier=task.name, **task.options)
-                task = await Repository.update_task(task.id, None, task_id=task_id, status="converting")
+    async def prepare(id):
+        task = await Repository.update_task(id, None, status="parsing")
+        XMLParser.fix_sk_id(task.source_file)
+        await dispatch_stage(submit_kpt, id)
+
+    run_stage(id, prepare)
+
+
+@celery.task()
+def submit_kpt(id: int):
+    """Загрузка выписки в Toolbox и запуск конвертации"""
+
+    async def submit(id):
+        task = await Repository.get_task(id)
+
+        # Свободного слота нет: этап возвращается в очередь с задержкой, процесс io не простаивает.
+        # celery_id не меняется, поэтому запись в БД не нужна; число ожидающих задач ограничивает TaskScheduler
+        wait = await governor.try_acquire(id)
+        if wait > 0:
+            submit_kpt.apply_async(args=(id,), task_id=task.celery_id, countdown=wait)
+            return
+
+        # Слот освобождает StatusPoller после завершения конвертации
+        try:
+            file_id = await NGToolbox.upload(task.source_file)
+            task_id = await NGToolbox.collect_kpt(file_id, identifier=task.name, **task.options)
+        except Exception:
+            await governor.release(id)
+            raise
+
+        await governor.on_success()
+
+        # Ожидание конвертации - этап StatusPoller, он же запускает fetch_kpt
+        await Repository.update_task(id, None, task_id=task_id, status="converting")
+
+    run_stage(id, submit)
+
+
+@celery.task()
+def fetch_kpt(id: int, file_url: str):
+    """Скачивание результата конвертации"""
+
+    async def fetch(id, file_url):
+        task = await Repository.get_task(id)
+        file_path = await Uploader.reserve_path("data/results/", task.name + ".zip")
+        print(f"Сохранение файла {task.name}")
+        try:
+            await NGToolbox.download(file_url, file_path)
+        except BaseException:
+            await Uploader.clear_file(file_path)
+            raise
+
+        await Repository.update_task(id, None, kpt_file=file_path)
+        await dispatch_stage(postprocess_kpt, id)
+
+    run_stage(id, fetch, file_url)
+
+
+@celery.task()
+def postprocess_kpt(id: int):
+    """Установка CRS в результатах конвертации"""
 
-            task = await check_status(task)
+    async def postprocess(id):
+        task = await Repository.get_task(id)
+        SHPParser.fix_crs(
+            task.kpt_file,
+            task.options.get("format", "ESRI Shapefile"),
+            by_feature=task.options.get("merge_objects", False),
+        )
 
-            await Repository.update_task(task.id, None, status="postprocessing")
-            SHPParser.fix_crs(task.kpt_file)
+        await Repository.update_task(id, None, status="completed")
 
-            await Repository.update_task(task.id, None, status="completed")
+    run_stage(id, postprocess)
 
-        asyncio.run(collect_kpt_async(id))
 
-    except Exception as e:
-        asyncio.run(Repository.update_task(id, None, status="failed", error=str(e)))
-        raise e
+STAGE_STATUSES = {
+    prepare_kpt.name: "queued",
+    submit_kpt.name: "uploading",
+    fetch_kpt.name: "downloading",
+    postprocess_kpt.name: "postprocessing",
+}
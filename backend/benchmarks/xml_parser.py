@@ -0,0 +1,117 @@
+"""Сравнение исправления координат КПТ через дерево и потоково: время и пиковая память.
+
+Запуск из каталога backend:
+    python -m benchmarks.xml_parser --blocks 900
+
+Каждый способ выполняется в отдельном процессе, чтобы пиковый RSS не учитывал память другого.
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+CRS_PARAMS = {"01:01": "01.2", "01:02": "01.2", "01:03": "01.2"}
+METHODS = ("_fix_xml_sk", "_fix_xml_sk_stream")
+KINDS = ("ok", "swap", "six", "bad", "mixed")
+
+
+def ordinates(rnd: random.Random, kind: str, count: int) -> str:
+    result = []
+    for number in range(count):
+        x6, y6 = (f"{rnd.randint(100000, 999999)}.{rnd.randint(10, 99)}" for _ in range(2))
+        x7, y7 = (f"{rnd.randint(1000000, 2999999)}.{rnd.randint(10, 99)}" for _ in range(2))
+        variants = {"ok": (x6, y7), "swap": (x7, y6), "six": (x6, y6), "bad": ("12", "34")}
+        x, y = rnd.choice(list(variants.values())) if kind == "mixed" else variants[kind]
+        result.append(f"<ordinate><x>{x}</x><y>{y}</y><ord_nmb>{number}</ord_nmb></ordinate>")
+    return "".join(result)
+
+
+def entity_spatial(rnd: random.Random, count: int, kind: str | None = None) -> str:
+    return (
+        "<entity_spatial><sk_id>old</sk_id><spatials_elements><spatial_element><ordinates>"
+        f"{ordinates(rnd, kind or rnd.choice(KINDS), count)}"
+        "</ordinates></spatial_element></spatials_elements></entity_spatial>"
+    )
+
+
+def generate_kpt(path: str, blocks: int, seed: int):
+    """КПТ из blocks кварталов: земельные участки, ОКС, границы квартала и муниципальных образований"""
+    rnd = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<extract_cadastral_plan_territory>\n')
+        f.write("<details_statement><note>1 &amp; 2</note></details_statement>\n<cadastral_blocks>\n")
+        for block in range(blocks):
+            f.write(f"<cadastral_block><cadastral_number>01:0{block % 3 + 1}:0101001</cadastral_number>")
+            f.write("<record_data><base_data><land_records>")
+            for record in range(20):
+                f.write(
+                    f"<land_record><object><common_data><cad_number>01:0{record % 3 + 1}:0101001:{record}"
+                    f"</cad_number></common_data></object><contours_location><contours><contour>"
+                    f"{entity_spatial(rnd, 30)}</contour></contours></contours_location></land_record>"
+                )
+            f.write("</land_records><build_records>")
+            for record in range(5):
+                f.write(
+                    f"<build_record><object><common_data><cad_number>01:02:0101001:{record}</cad_number>"
+                    f"</common_data></object><contours>{entity_spatial(rnd, 10)}</contours></build_record>"
+                )
+            f.write("</build_records></base_data></record_data>")
+            f.write(f"<spatial_data>{entity_spatial(rnd, 10)}</spatial_data>")
+            f.write(
+                "<municipal_boundaries><municipal_boundary_record><b_object_municipal_boundary><b_object>"
+                "<reg_numb_border>01:01-3.1</reg_numb_border></b_object></b_object_municipal_boundary>"
+                f"<b_contours_location><contours><contour>{entity_spatial(rnd, 5, 'ok')}</contour></contours>"
+                "</b_contours_location></municipal_boundary_record></municipal_boundaries>"
+            )
+            f.write("</cadastral_block>\n")
+        f.write("</cadastral_blocks>\n</extract_cadastral_plan_territory>\n")
+
+
+def measure(method: str, path: str):
+    """Выполняется в дочернем процессе: печатает время и пиковый RSS"""
+    from app.services.parsers import XMLParser
+
+    started = time.perf_counter()
+    with open(path, "rb") as source, open(os.devnull, "wb") as destination:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            getattr(XMLParser, method)(source, destination, crs_params=CRS_PARAMS)
+    elapsed = time.perf_counter() - started
+
+    # ru_maxrss в Linux - KiB
+    print(f"{elapsed:.2f} {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=900, help="количество кварталов (900 - около 50 МБ)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--file", help="готовый XML вместо сгенерированного")
+    parser.add_argument("--measure", choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.file)
+        return
+
+    os.environ.setdefault("NGT_TOKEN", "")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.file
+        if path is None:
+            path = os.path.join(tmp_dir, "kpt.xml")
+            generate_kpt(path, args.blocks, args.seed)
+        print(f"Файл: {path}, {os.path.getsize(path) / 1024 / 1024:.1f} МБ")
+
+        for method in METHODS:
+            command = [sys.executable, "-m", "benchmarks.xml_parser", "--measure", method, "--file", path]
+            elapsed, rss = subprocess.run(command, capture_output=True, text=True, check=True).stdout.split()
+            print(f"{method}: {elapsed} с, пиковый RSS {rss} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+os.environ.setdefault("NGT_TOKEN", "")
+
+from app.services.parsers import Parser  # noqa: E402
+
+MEMBERS = {
+    "data/report.xml": b"<report>" + b"1234567890" * 10000 + b"</report>",
+    "data/other.xml": b"<other/>",
+    "readme.txt": "Кадастровый план территории".encode(),
+}
+
+
+def upper(src, dst):
+    dst.write(src.read().upper())
+
+
+def is_xml(name: str) -> bool:
+    return name.endswith(".xml")
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+        self.arc_path = os.path.join(self.tmp_dir.name, "source.zip")
+        with zipfile.ZipFile(self.arc_path, "w") as archive:
+            archive.mkdir("data")
+            archive.writestr("data/report.xml", MEMBERS["data/report.xml"], zipfile.ZIP_DEFLATED)
+            archive.writestr("data/other.xml", MEMBERS["data/other.xml"], zipfile.ZIP_STORED)
+            # Потоковая запись: размеры и CRC в дескрипторе данных после файла
+            with archive.open("readme.txt", "w") as f:
+                f.write(MEMBERS["readme.txt"])
+
+    def read(self) -> dict[str, bytes]:
+        with zipfile.ZipFile(self.arc_path) as archive:
+            self.assertIsNone(archive.testzip())
+            return {info.filename: archive.read(info) for info in archive.infolist() if not info.is_dir()}
+
+    def check_rewrite(self):
+        Parser.rewrite_archive(self.arc_path, is_xml, upper)
+
+        expected = {name: data.upper() if is_xml(name) else data for name, data in MEMBERS.items()}
+        self.assertEqual(self.read(), expected)
+        with zipfile.ZipFile(self.arc_path) as archive:
+            self.assertEqual([info.filename for info in archive.infolist()][0], "data/")
+            # Файл без изменений скопирован без перепаковки
+            self.assertEqual(archive.getinfo("readme.txt").compress_type, zipfile.ZIP_STORED)
+
+    def test_rewrite_archive(self):
+        self.check_rewrite()
+
+    def test_rewrite_archive_by_parts(self):
+        # Файлы обрабатываются в отдельные архивы и переносятся из них без перепаковки (без пула процессов)
+        sequential_map = staticmethod(lambda func, items: [func(*args) for args in items])
+        with mock.patch.object(Parser, "workers", 2), mock.patch.object(Parser, "_map", sequential_map):
+            self.check_rewrite()
+
+    def test_patch_archive(self):
+        def parsing_func(tmp_dir: str):
+            Path(tmp_dir, "data/report.xml").write_bytes(b"<report/>")
+            Path(tmp_dir, "data/other.xml").unlink()
+            Path(tmp_dir, "data/new.xml").write_bytes(b"<new/>")
+
+        Parser.patch_archive(self.arc_path, is_xml, parsing_func)
+
+        expected = {"data/report.xml": b"<report/>", "readme.txt": MEMBERS["readme.txt"], "data/new.xml": b"<new/>"}
+        self.assertEqual(self.read(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
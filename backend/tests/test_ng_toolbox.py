@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("NGT_TOKEN", "")
+
+from app.services.governor import governor  # noqa: E402
+from app.services.ng_toolbox import NGToolbox  # noqa: E402
+from tests.toolbox_stub import ToolboxStub  # noqa: E402
+
+RESULT = bytes(range(256)) * 4096  # 1 MB
+
+
+class NGToolboxTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.stub = ToolboxStub(result=RESULT).start()
+        self.addCleanup(self.stub.stop)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+        for name, value in (
+            ("headers", {"Authorization": "Token test"}),
+            ("upload_url", f"{self.stub.url}/api/upload/?filename="),
+            ("execute_url", f"{self.stub.url}/api/json/execute/"),
+            ("status_url", f"{self.stub.url}/api/json/status/"),
+            ("chunk_size", 64 * 1024),
+        ):
+            patcher = mock.patch.object(NGToolbox, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Состояние ограничителя хранится в Redis, здесь проверяется только вызов
+        patcher = mock.patch.object(governor, "on_throttle", mock.AsyncMock())
+        self.on_throttle = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await NGToolbox.aclose()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmp_dir.name, name)
+
+    async def test_upload_sends_content_length(self):
+        with open(self.path("source.zip"), "wb") as f:
+            f.write(RESULT)
+
+        self.assertEqual(await NGToolbox.upload(self.path("source.zip")), "file-1")
+        self.assertEqual(self.stub.uploads, [len(RESULT)])
+
+    async def test_upload_retries_after_throttle(self):
+        self.stub.throttle = 1
+        with open(self.path("source.zip"), "wb") as f:
+            f.write(RESULT)
+
+        self.assertEqual(await NGToolbox.upload(self.path("source.zip")), "file-1")
+        self.on_throttle.assert_awaited_once_with(1.0)
+        # Повторная попытка отправляет файл целиком
+        self.assertEqual(self.stub.uploads, [len(RESULT)])
+
+    async def test_download_resumes_with_range(self):
+        self.stub.drops = 2
+        file_path = await NGToolbox.download(f"{self.stub.url}/result.zip", self.path("result.zip"))
+
+        with open(file_path, "rb") as f:
+            self.assertEqual(f.read(), RESULT)
+        self.assertEqual(len(self.stub.ranges), 3)
+        self.assertEqual(self.stub.ranges[0], 0)
+        self.assertTrue(0 < self.stub.ranges[1] < self.stub.ranges[2] < len(RESULT))
+        self.assertFalse(os.path.exists(file_path + ".part"))
+
+    async def test_collect_and_status(self):
+        task_id = await NGToolbox.collect_kpt("file-1", identifier="kpt")
+        status = await NGToolbox.status(task_id)
+
+        self.assertEqual(status["state"], "SUCCESS")
+        self.assertEqual(status["output"][0]["value"], f"{self.stub.url}/result.zip")
+
+    async def test_collect_retries_after_throttle(self):
+        self.stub.execute_errors = [503]
+        self.assertEqual(await NGToolbox.collect_kpt("file-1", identifier="kpt"), "task-1")
+        self.assertEqual(self.stub.executes, 2)
+
+    async def test_collect_not_retried_after_bad_gateway(self):
+        # Сервер мог принять запрос до ответа прокси, повтор запустил бы конвертацию дважды
+        self.stub.execute_errors = [502]
+        with self.assertRaises(Exception):
+            await NGToolbox.collect_kpt("file-1", identifier="kpt")
+        self.assertEqual(self.stub.executes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("NGT_TOKEN", "")
+
+import geopandas as gpd  # noqa: E402
+import pyogrio  # noqa: E402
+from shapely.geometry import Point, Polygon  # noqa: E402
+
+from app.services.crs_registry import crs_registry  # noqa: E402
+from app.services.parsers import SHPParser  # noqa: E402
+
+GEOMETRY = [
+    Polygon([(1300000, 500000), (1300100, 500000), (1300100, 500100)]),
+    None,
+    Point(1300050, 500050),
+]
+
+
+def same_geometry(left, right) -> bool:
+    return all((a is None and b is None) or a.equals_exact(b, 1e-9) for a, b in zip(left, right))
+
+
+class SetCrsTest(unittest.TestCase):
+    def setUp(self):
+        self.gdf = gpd.GeoDataFrame({"sk": ["01.1"] * len(GEOMETRY)}, geometry=GEOMETRY)
+        self.expected = self.gdf.set_crs(crs_registry.get_params()["01.1"]).to_crs(epsg=4326)
+
+    def test_layer_matches_to_crs(self):
+        result = SHPParser._set_layer_crs(self.gdf, "01.1")
+        self.assertEqual(result.crs.to_epsg(), 4326)
+        self.assertTrue(same_geometry(result.geometry, self.expected.geometry))
+
+    def test_features_match_to_crs(self):
+        result, unknown = SHPParser._set_features_crs(self.gdf, "layer")
+        self.assertIsNone(unknown)
+        self.assertEqual(result.crs.to_epsg(), 4326)
+        self.assertTrue(same_geometry(result.geometry, self.expected.geometry))
+
+    def test_features_without_sk_keep_source_geometry(self):
+        self.gdf["sk"] = ["01.1", "", "Ошибка в координатах"]
+        result, unknown = SHPParser._set_features_crs(self.gdf, "layer")
+
+        self.assertTrue(same_geometry(result.geometry, self.expected.geometry[:1]))
+        self.assertEqual(list(unknown.index), [1, 2])
+        self.assertTrue(same_geometry(unknown.geometry, self.gdf.geometry[1:]))
+
+
+class FixLayerFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.gdf = gpd.GeoDataFrame({"sk": ["01.1", "Ошибка в координатах"]}, geometry=[GEOMETRY[0]] * 2)
+
+    def test_shapefile_features_without_sk_are_written_separately(self):
+        file_path = os.path.join(self.tmp_dir.name, "layer.shp")
+        pyogrio.write_dataframe(self.gdf, file_path)
+
+        SHPParser._fix_layer_file(file_path, "ESRI Shapefile", by_feature=True)
+
+        self.assertEqual(len(pyogrio.read_dataframe(file_path)), 1)
+        unknown = pyogrio.read_dataframe(os.path.join(self.tmp_dir.name, "layer_no_sk.shp"))
+        # Shapefile меняет порядок обхода контура, поэтому геометрия сравнивается топологически
+        self.assertEqual(len(unknown), 1)
+        self.assertTrue(unknown.geometry.iloc[0].equals(GEOMETRY[0]))
+
+    def test_gpkg_features_without_sk_are_written_to_layer(self):
+        file_path = os.path.join(self.tmp_dir.name, "result.gpkg")
+        pyogrio.write_dataframe(self.gdf, file_path, layer="parcels", driver="GPKG")
+
+        SHPParser._fix_layer_file(file_path, "GPKG", by_feature=True)
+
+        self.assertEqual(sorted(pyogrio.list_layers(file_path)[:, 0]), ["parcels", "parcels_no_sk"])
+        self.assertEqual(len(pyogrio.read_dataframe(file_path, layer="parcels")), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import io
+import os
+import unittest
+from xml.etree import ElementTree as ET
+
+os.environ.setdefault("NGT_TOKEN", "")
+
+from app.services.parsers import XMLParser  # noqa: E402
+
+CRS_PARAMS = {"72:01": "72.1", "72:02": "72.2"}
+
+ENTITY_SPATIAL = (
+    "<entity_spatial><sk_id>old</sk_id><spatials_elements><spatial_element><ordinates>"
+    "<ordinate><x>512345.10</x><y>1512345.20</y><ord_nmb>1</ord_nmb></ordinate>"
+    "<ordinate><x>1512345.10</x><y>512345.20</y><ord_nmb>2</ord_nmb></ordinate>"
+    "</ordinates></spatial_element></spatials_elements></entity_spatial>"
+)
+
+NAMESPACED_KPT = f"""<?xml version="1.0" encoding="utf-8"?>
+<extract_cadastral_plan_territory xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xsi:noNamespaceSchemaLocation="x.xsd">
+  <details_statement xmlns:ext="urn:ext"><ext:note ext:kind="a&amp;b">1 &lt; 2</ext:note></details_statement>
+  <cadastral_blocks>
+    <cadastral_block>
+      <cadastral_number>72:01:0101001</cadastral_number>
+      <record_data><base_data><land_records>
+        <land_record xsi:type="land">
+          <object><common_data><cad_number>72:01:0101001:1</cad_number></common_data></object>
+          <meta xmlns="urn:meta"><value>default namespace</value></meta>
+          <contours_location><contours><contour>{ENTITY_SPATIAL}</contour></contours></contours_location>
+        </land_record>
+        <land_record xmlns:ext="urn:other">
+          <object><common_data><cad_number>72:02:0101001:2</cad_number></common_data></object>
+          <ext:extra ext:kind="rebound" />
+          <contours_location><contours><contour>{ENTITY_SPATIAL}</contour></contours></contours_location>
+        </land_record>
+      </land_records></base_data></record_data>
+      <spatial_data>{ENTITY_SPATIAL}</spatial_data>
+    </cadastral_block>
+  </cadastral_blocks>
+</extract_cadastral_plan_territory>
+"""
+
+
+def fix(fix_func, xml: str) -> bytes:
+    destination = io.BytesIO()
+    fix_func(io.BytesIO(xml.encode("utf-8")), destination, crs_params=CRS_PARAMS)
+    return destination.getvalue()
+
+
+def canonicalize(xml: bytes) -> str:
+    # Префиксы заменяются по uri: вывод ElementTree называет пространства имен ns0, ns1...
+    return ET.canonicalize(xml.decode("utf-8"), rewrite_prefixes=True)
+
+
+class StreamingFixTest(unittest.TestCase):
+    def test_namespaced_output_matches_tree(self):
+        streamed = fix(XMLParser._fix_xml_sk_stream, NAMESPACED_KPT)
+        ET.fromstring(streamed)  # вывод должен быть корректным XML
+        self.assertEqual(canonicalize(streamed), canonicalize(fix(XMLParser._fix_xml_sk, NAMESPACED_KPT)))
+
+    def test_namespace_declarations_are_kept(self):
+        root = ET.fromstring(fix(XMLParser._fix_xml_sk_stream, NAMESPACED_KPT))
+        self.assertEqual(root.get("{http://www.w3.org/2001/XMLSchema-instance}noNamespaceSchemaLocation"), "x.xsd")
+        self.assertIsNotNone(root.find(".//{urn:other}extra"))
+        self.assertIsNotNone(root.find(".//{urn:meta}value"))
+
+    def test_coordinates_are_fixed(self):
+        root = ET.fromstring(fix(XMLParser._fix_xml_sk_stream, NAMESPACED_KPT))
+        self.assertNotIn("old", [elem.text for elem in root.iter("sk_id")])
+
+
+if __name__ == "__main__":
+    unittest.main()
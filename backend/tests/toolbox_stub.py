@@ -0,0 +1,115 @@
+"""Локальная заглушка API NextGIS Toolbox для тестов NGToolbox.
+
+Поддерживает то, что нужно проверить без внешнего сервера:
+- ответ 429 с Retry-After на первые throttle запросов загрузки;
+- заданные ответы с ошибкой на запросы запуска конвертации;
+- загрузку файла только с Content-Length (без chunked);
+- скачивание результата с обрывом соединения и продолжением по Range.
+"""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ToolboxStub:
+    def __init__(self, result: bytes = b"", throttle: int = 0, retry_after: str = "1", drops: int = 0):
+        self.result = result  # содержимое файла результата
+        self.throttle = throttle  # число ответов 429 перед успешной загрузкой
+        self.retry_after = retry_after
+        self.drops = drops  # число обрывов соединения при скачивании
+        self.execute_errors = []  # коды ответов на запросы запуска конвертации перед успешным
+        self.executes = 0  # число принятых запросов запуска конвертации
+        self.uploads = []  # размеры принятых файлов
+        self.ranges = []  # начальные смещения запросов скачивания
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, code: int, body: bytes = b"", headers: dict | None = None):
+                self.send_response(code)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = self.headers.get("Content-Length")
+                if length is None:
+                    self.close_connection = True
+                    return self._send(411)
+                body = self.rfile.read(int(length))
+
+                if self.path.startswith("/api/upload/"):
+                    if stub.throttle:
+                        stub.throttle -= 1
+                        return self._send(429, headers={"Retry-After": stub.retry_after})
+                    stub.uploads.append(len(body))
+                    return self._send(200, b"file-1")
+
+                if self.path.startswith("/api/json/execute/"):
+                    stub.executes += 1
+                    if stub.execute_errors:
+                        return self._send(stub.execute_errors.pop(0), headers={"Retry-After": stub.retry_after})
+                    return self._send(200, json.dumps({"task_id": "task-1"}).encode())
+
+                self._send(404)
+
+            def do_GET(self):
+                if self.path.startswith("/api/json/status/"):
+                    output = [{"value": f"{stub.url}/result.zip"}]
+                    return self._send(200, json.dumps({"state": "SUCCESS", "output": output}).encode())
+
+                if self.path == "/result.zip":
+                    return self._download()
+
+                self._send(404)
+
+            def _download(self):
+                match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+                start = int(match.group(1)) if match else 0
+                stub.ranges.append(start)
+
+                body = stub.result[start:]
+                self.send_response(206 if start else 200)
+                if start:
+                    self.send_header("Content-Range", f"bytes {start}-{len(stub.result) - 1}/{len(stub.result)}")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+
+                if not stub.drops:
+                    self.wfile.write(body)
+                    return
+
+                # Обрыв соединения после трети ответа
+                stub.drops -= 1
+                self.wfile.write(body[: len(body) // 3])
+                self.wfile.flush()
+                self.close_connection = True
+                self.connection.shutdown(2)
+
+        return Handler
@@ -0,0 +1,43 @@
+export function addStatistics(statistics, status, count) {
+    // Тот же расчет, что и add_statistics в Repository
+    if (!status || !count) return;
+
+    if (status === "failed") statistics.failed += count;
+    else if (status === "completed") statistics.completed += count;
+    else if (status !== "accepted" && status !== "queued") statistics.in_progress += count;
+
+    statistics.loaded += count;
+    statistics.remaining = statistics.loaded - statistics.completed - statistics.failed;
+}
+
+export class EventStream {
+    constructor(url = "/data/events") {
+        this.url = url;
+        this.source = null;
+        this.listeners = new Set();
+        this.openListeners = new Set();
+    }
+
+    init() {
+        this.source = new EventSource(this.url);
+
+        // open вызывается и после переподключения: пропущенные события восполняются перезагрузкой данных
+        this.source.onopen = () => this.openListeners.forEach((listener) => listener());
+        this.source.onmessage = (e) => {
+            const data = JSON.parse(e.data);
+            this.listeners.forEach((listener) => listener(data));
+        };
+
+        return this;
+    }
+
+    subscribe(listener, onOpen = null) {
+        this.listeners.add(listener);
+        if (onOpen) this.openListeners.add(onOpen);
+    }
+
+    unsubscribe(listener, onOpen = null) {
+        this.listeners.delete(listener);
+        if (onOpen) this.openListeners.delete(onOpen);
+    }
+}
@@ -1,11 +1,12 @@
 import PauseBtn from "bootstrap-icons/icons/pause-fill.svg";
 import PlayBtn from "bootstrap-icons/icons/play-fill.svg";
 import { UploadHandler } from "./uploader.js";
-import { table } from "..";
+import { addStatistics } from "./events.js";
+import { events, table } from "..";
 
 export class StatisticsPanel {
     constructor() {
-        this.updateInterval = null;
+        this.statistics = null;
     }
 
     init() {
@@ -38,24 +39,36 @@ export class StatisticsPanel {
     async fetchStatistics() {
         try {
             const response = await fetch("/data/statistics");
-            const data = await response.json();
-
-            this.updateStatistics(data.loaded, data.in_progress, data.completed, data.failed, data.remaining);
+            this.statistics = await response.json();
+            this.renderStatistics();
         } catch (error) {
             console.error(error);
         }
     }
 
+    renderStatistics() {
+        const data = this.statistics;
+        this.updateStatistics(data.loaded, data.in_progress, data.completed, data.failed, data.remaining);
+    }
+
+    applyEvent(event) {
+        if (event.type !== "task" || !this.statistics) return;
+
+        addStatistics(this.statistics, event.previous_status, -1);
+        addStatistics(this.statistics, event.status, 1);
+        this.renderStatistics();
+    }
+
     startUpdate() {
+        // Статистика загружается один раз (и после переподключения), далее меняется по событиям сервера
+        this.eventListener = (event) => this.applyEvent(event);
+        this.openListener = () => this.fetchStatistics();
+        events.subscribe(this.eventListener, this.openListener);
         this.fetchStatistics();
-        this.updateInterval = setInterval(() => {
-            this.fetchStatistics();
-        }, 8000);
     }
 
     stopUpdate() {
-        clearInterval(this.updateInterval);
-        this.updateInterval = null;
+        events.unsubscribe(this.eventListener, this.openListener);
     }
 
     async initPauseButton() {
@@ -103,7 +116,7 @@ export class StatisticsPanel {
             table.filter_by_status();
         };
         filterButtons[1].onclick = () => {
-            table.filter_by_status(["parsing", "converting", "postprocessing"]);
+            table.filter_by_status(["parsing", "uploading", "converting", "downloading", "postprocessing"]);
         };
         filterButtons[2].onclick = () => {
             table.filter_by_status(["completed"]);
@@ -112,7 +125,7 @@ export class StatisticsPanel {
             table.filter_by_status(["failed"]);
         };
         filterButtons[4].onclick = () => {
-            table.filter_by_status(["accepted", "parsing", "converting", "postprocessing"]);
+            table.filter_by_status(["accepted", "queued", "parsing", "uploading", "converting", "downloading", "postprocessing"]);
         };
     }
 }
@@ -7,37 +7,68 @@ import ZipIcon from "bootstrap-icons/icons/file-zip.svg";
 import TrashIcon from "bootstrap-icons/icons/trash.svg";
 import RestartIcon from "bootstrap-icons/icons/arrow-clockwise.svg";
 
-import { uploader } from "..";
-
-function getStatusPriority(status) {
-    const priorities = {
-        parsing: 1,
-        converting: 2,
-        postprocessing: 3,
-        failed: 4,
-        completed: 5,
-        accepted: 6,
-    };
-    return priorities[status] || 0;
+import { addStatistics } from "./events.js";
+import { events, uploader } from "..";
+
+async function fetchAllPages(url, params = {}) {
+    const items = [];
+    let cursor = null;
+
+    do {
+        const query = new URLSearchParams({ ...params, limit: 1000 });
+        if (cursor !== null) query.set("after", cursor);
+
+        const response = await fetch(`${url}?${query}`);
+        const page = await response.json();
+
+        items.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor !== null);
+
+    return items;
+}
+
+async function fetchPage(url, params = {}) {
+    const query = new URLSearchParams();
+    for (const [key, value] of Object.entries(params)) {
+        if (Array.isArray(value)) value.forEach((item) => query.append(key, item));
+        else if (value !== null && value !== undefined) query.set(key, value);
+    }
+
+    const response = await fetch(`${url}?${query}`);
+    return response.json();
 }
 
 export class KptTable {
     constructor() {
         this.el = null;
         this.table = null;
-        this.refreshInterval = null;
+        this.tableType = null;
+        this.eventListener = null;
+        this.openListener = null;
+        this.drawTimeout = null;
+        this.reloadTimeout = null;
+
+        // Задачи загружаются постранично с сервера: курсор after для каждой уже открытой страницы
+        this.statuses = [];
+        this.cursors = [null];
+        this.pageLength = null;
 
         this.baseOptions = {
             language: languageRU,
             responsive: true,
             destroy: true,
+            rowId: "id",
             order: [[2, "asc"]],
         };
 
         this.taskOptions = {
-            ajax: {
-                url: "/data/tasks",
-                dataSrc: "",
+            serverSide: true,
+            // Сервер отдает задачи в порядке добавления, фильтр - кнопки статусов на панели
+            ordering: false,
+            searching: false,
+            ajax: (data, callback) => {
+                this.fetchTaskPage(data).then(callback);
             },
             columns: [
                 { data: "id", title: "ID", className: "table-id" },
@@ -50,16 +81,11 @@ export class KptTable {
                 {
                     targets: 2,
                     render: function (data, type, row) {
-                        const display = `
+                        return `
                             <div class="table-stats__container">
                                 <div>${KptTable.getStatus(row, "Конвертация выписки:")}</div>
                             </div>
                         `;
-
-                        if (type === "sort") return getStatusPriority(row.status);
-                        if (type === "filter") return row.status;
-
-                        return display;
                     },
                 },
                 {
@@ -94,9 +120,8 @@ export class KptTable {
             ...this.baseOptions,
         };
         this.groupOptions = {
-            ajax: {
-                url: "/data/groups",
-                dataSrc: "",
+            ajax: (data, callback) => {
+                fetchAllPages("/data/groups").then((items) => callback({ data: items }));
             },
             columns: [
                 { data: "id", title: "ID", className: "table-id" },
@@ -181,19 +206,105 @@ export class KptTable {
     }
 
     initTable(tableType = "tasks") {
+        this.tableType = tableType;
+        this.cursors = [null];
         if (tableType === "tasks") this.table = new DataTable(this.el, this.taskOptions);
         else if (tableType === "groups") this.table = new DataTable(this.el, this.groupOptions);
     }
 
+    async fetchTaskPage(data) {
+        const params = { fields: "id,name,status,error,created_at", status: this.statuses, limit: data.length };
+        if (data.length !== this.pageLength) {
+            this.pageLength = data.length;
+            this.cursors = [null];
+        }
+
+        // Курсор страницы известен, если предыдущие страницы уже открывались; иначе он находится
+        // по идентификаторам промежуточных страниц
+        const pageIndex = Math.floor(data.start / data.length);
+        while (this.cursors.length <= pageIndex) {
+            const page = await fetchPage("/data/tasks", { ...params, fields: "id", after: this.cursors.at(-1) });
+            if (page.next_cursor === null) break;
+            this.cursors.push(page.next_cursor);
+        }
+
+        const index = Math.min(pageIndex, this.cursors.length - 1);
+        const page = await fetchPage("/data/tasks", { ...params, after: this.cursors[index] });
+        if (page.next_cursor !== null) this.cursors[index + 1] = page.next_cursor;
+
+        const start = index * data.length;
+        const total = page.total ?? start + page.items.length + (page.next_cursor === null ? 0 : 1);
+        return { draw: data.draw, data: page.items, recordsTotal: total, recordsFiltered: total };
+    }
+
     startUpdate() {
-        this.refreshInterval = setInterval(() => {
-            this.table.ajax.reload(null, false);
-        }, 5000);
+        // Строки меняются по событиям сервера; после переподключения таблица загружается заново
+        this.eventListener = (event) => this.applyEvent(event);
+        this.openListener = () => this.update();
+        events.subscribe(this.eventListener, this.openListener);
     }
 
     stopUpdate() {
-        if (this.refreshInterval) clearInterval(this.refreshInterval);
-        this.refreshInterval = null;
+        events.unsubscribe(this.eventListener, this.openListener);
+        clearTimeout(this.drawTimeout);
+        clearTimeout(this.reloadTimeout);
+        this.drawTimeout = this.reloadTimeout = null;
+    }
+
+    scheduleDraw() {
+        // События приходят пачками (загрузка группы), поэтому таблица перерисовывается не чаще раза в 500 мс
+        if (this.drawTimeout) return;
+        this.drawTimeout = setTimeout(() => {
+            this.drawTimeout = null;
+            this.table.draw(false);
+        }, 500);
+    }
+
+    scheduleReload() {
+        if (this.reloadTimeout) return;
+        this.reloadTimeout = setTimeout(() => {
+            this.reloadTimeout = null;
+            this.update();
+        }, 500);
+    }
+
+    applyEvent(event) {
+        if (this.tableType === "tasks") this.applyTaskEvent(event);
+        else if (this.tableType === "groups") this.applyGroupEvent(event);
+    }
+
+    applyTaskEvent(event) {
+        if (event.type !== "task") return;
+
+        const matches = (status) => Boolean(status) && (!this.statuses.length || this.statuses.includes(status));
+        const row = this.table.row(`#${event.id}`);
+
+        // Строки текущей страницы обновляются на месте. Новые, удаленные, вошедшие в фильтр и вышедшие из него
+        // задачи меняют состав страниц, поэтому страница загружается с сервера заново
+        if (row.any() && matches(event.status)) {
+            row.data({ ...row.data(), status: event.status, error: event.error });
+        } else if (row.any() || (matches(event.status) && !matches(event.previous_status))) {
+            this.scheduleReload();
+        }
+    }
+
+    applyGroupEvent(event) {
+        const row = this.table.row(`#${event.group_id}`);
+
+        if (event.type === "group_deleted") {
+            if (row.any()) row.remove();
+        } else if (!row.any()) {
+            // Новая группа: название и дата есть только в данных группы
+            if (event.status) this.scheduleReload();
+            return;
+        } else {
+            const data = row.data();
+            addStatistics(data.statistics, event.previous_status, -1);
+            addStatistics(data.statistics, event.status, 1);
+            row.invalidate();
+        }
+
+        this.scheduleDraw();
     }
 
     update() {
@@ -206,8 +317,11 @@ export class KptTable {
 
         const statuses = {
             accepted: `<div class="kpt-badge info"><p>${message}</p><span>Принято к исполнению</span></div>`,
+            queued: `<div class="kpt-badge info"><p>${message}</p><span>В очереди</span></div>`,
             parsing: `<div class="kpt-badge warning"><p>${message}</p><span>Подготовка XML</span></div>`,
+            uploading: `<div class="kpt-badge warning"><p>${message}</p><span>Загрузка в Toolbox</span></div>`,
             converting: `<div class="kpt-badge warning"><p>${message}</p><span>Конвертация XML</span></div>`,
+            downloading: `<div class="kpt-badge warning"><p>${message}</p><span>Скачивание результата</span></div>`,
             postprocessing: `<div class="kpt-badge warning"><p>${message}</p><span>Постобработка</span></div>`,
             completed: `<div class="kpt-badge success"><p>${message}</p><span>Готово</span></div>`,
             failed: `<div class="kpt-badge danger"><p>${message}</p><span>Ошибка</span></div><div class="kpt-badge danger"><p>${error}</p></div>`,
@@ -218,7 +332,8 @@ export class KptTable {
     }
 
     static getDate(date) {
-        const d = new Date(date + "Z");
+        // SQLite возвращает время UTC без часового пояса, PostgreSQL - с поясом
+        const d = new Date(/(Z|[+-]\d{2}:\d{2})$/.test(date) ? date : date + "Z");
         return d.toLocaleString(undefined, {
             year: "numeric",
             month: "long",
@@ -245,6 +360,14 @@ export class KptTable {
     }
 
     filter_by_status(statuses = []) {
+        if (this.tableType === "tasks") {
+            // Фильтр применяется на сервере, страницы считаются заново с первой
+            this.statuses = statuses;
+            this.cursors = [null];
+            this.table.ajax.reload();
+            return;
+        }
+
         this.table
             .column(2)
             .search((row) => {